@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Compiles the synthetic workloads to text (Parser.parse), to events (Parser.iterevents) and to an ElementTree
+(events.build_tree), reporting how long each took, and checks that writing the events out as text gives the
+text output.
+
+Usage: python benchmarks/events.py [--scale 1] [NAME ...]
+"""
+
+import os, sys, time, shutil, tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import markuploader
+from rapydml.compiler import Parser
+from rapydml.util import OutputBuffer
+from rapydml.events import TextWriter, build_tree
+from workloads import WORKLOADS, generate
+
+RAPYDML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rapydml')
+
+def write_text(events, minify=False):
+	# returns text output the events stand for
+	output = OutputBuffer()
+	writer = TextWriter(output, minify)
+	for kind, data in events:
+		writer.write(kind, data)
+	return output.getvalue()
+
+def main():
+	parser = argparse.ArgumentParser(description='Compares text, event and tree output of the workloads.')
+	parser.add_argument('names', metavar='NAME', nargs='*', help='Workloads to run, all of them by default')
+	parser.add_argument('--scale', type=float, default=1.0, help='Multiplier for the default size of each workload')
+	args = parser.parse_args()
+
+	valid_tags = markuploader.load('html', RAPYDML_DIR)
+	directory = tempfile.mkdtemp(prefix='rapydml-events')
+	failed = False
+	try:
+		print '%-18s %8s %8s %8s %8s' % ('workload', 'text s', 'events s', 'tree s', 'events')
+		for name in args.names or sorted(WORKLOADS):
+			path = os.path.join(directory, name + '.pyml')
+			with open(path, 'w') as page:
+				page.write(generate(name, max(1, int(WORKLOADS[name][1] * args.scale))))
+			start = time.time()
+			text = Parser(valid_tags).parse(path)
+			text_time = time.time() - start
+			start = time.time()
+			with open(path, 'r') as page:
+				events = list(Parser(valid_tags).iterevents(page, path, directory))
+			events_time = time.time() - start
+			start = time.time()
+			try:
+				build_tree(events, 'document')
+				tree_time = '%8.3f' % (time.time() - start)
+			except Exception as error:
+				tree_time = '%8s' % 'failed'
+				print '%s: %s' % (name, error)
+			print '%-18s %8.3f %8.3f %s %8d' % (name, text_time, events_time, tree_time, len(events))
+			if write_text(events) != text:
+				failed = True
+				print '%s: events written out differ from the text output' % name
+	finally:
+		shutil.rmtree(directory)
+	if failed:
+		sys.exit(1)
+	print 'events written out match text output'
+
+if __name__ == '__main__':
+	main()
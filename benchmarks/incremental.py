@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Edits one line at a time in a large page and recompiles it with Parser.parse_incremental, reusing blocks
+of the previous compile, checking that the output matches a full compile of the edited page and reporting
+how long both took.
+
+Usage: python benchmarks/incremental.py [--workload template_engines] [--scale 1] [--edits 10] [--seed 0]
+"""
+
+import os, sys, time, random, shutil, tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import markuploader
+from rapydml.compiler import Parser
+from workloads import WORKLOADS, generate
+
+RAPYDML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rapydml')
+
+def edit(lines, rng):
+	# changes a digit on a random line, or duplicates the line if it has none
+	index = rng.randrange(len(lines))
+	line = lines[index]
+	for position, char in enumerate(line):
+		if char.isdigit():
+			lines[index] = line[:position] + str((int(char) + 1) % 10) + line[position + 1:]
+			return index + 1
+	lines.insert(index, line)
+	return index + 1
+
+def main():
+	parser = argparse.ArgumentParser(description='Measures incremental recompilation after single-line edits.')
+	parser.add_argument('--workload', choices=sorted(WORKLOADS), default='template_engines',
+						help='Workload the page is generated from')
+	parser.add_argument('--scale', type=float, default=1.0, help='Multiplier for the default size of the workload')
+	parser.add_argument('--edits', type=int, default=10, help='Number of edits to make')
+	parser.add_argument('--seed', type=int, default=0, help='Seed for picking lines to edit')
+	args = parser.parse_args()
+
+	rng = random.Random(args.seed)
+	valid_tags = markuploader.load('html', RAPYDML_DIR)
+	directory = tempfile.mkdtemp(prefix='rapydml-incremental')
+	failed = False
+	try:
+		path = os.path.join(directory, args.workload + '.pyml')
+		lines = generate(args.workload, max(1, int(WORKLOADS[args.workload][1] * args.scale))).splitlines(True)
+		with open(path, 'w') as page:
+			page.writelines(lines)
+		incremental = Parser(valid_tags)
+		start = time.time()
+		incremental.parse_incremental(path)
+		print '%d lines, first compile %.3fs' % (len(lines), time.time() - start)
+		print '%-8s %10s %12s %8s' % ('line', 'full s', 'incremental s', 'reused')
+		for i in range(args.edits):
+			line_num = edit(lines, rng)
+			with open(path, 'w') as page:
+				page.writelines(lines)
+			start = time.time()
+			expected = Parser(valid_tags).parse(path)
+			full = time.time() - start
+			start = time.time()
+			output = incremental.parse_incremental(path, incremental.blocks)
+			elapsed = time.time() - start
+			print '%-8d %10.3f %12.3f %8s' % (line_num, full, elapsed,
+					'%d/%d' % (incremental.reused_blocks, len(incremental.blocks)))
+			if output != expected:
+				failed = True
+				print 'output after editing line %d differs from full compile' % line_num
+	finally:
+		shutil.rmtree(directory)
+	if failed:
+		sys.exit(1)
+	print 'all outputs match'
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Measures how writing output (events.TextWriter) scales with the size of the output. Every simulated element
+writes a start tag and then gets collapsed into a self-closing tag by rewriting the last 2 characters, which
+is the same pattern TextWriter produces for empty elements.
+
+Usage: python benchmarks/output_buffer.py [--naive]
+
+--naive also times the old string-concatenation approach (quadratic, capped at 10k lines)
+"""
+
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml.compiler import Parser
+
+SIZES = [1000, 10000, 100000, 1000000]
+NAIVE_LIMIT = 10000
+
+class NaiveOutput:
+	# the original implementation, kept here for comparison
+	def __init__(self):
+		self.output = ''
+	
+	def write(self, line, overlap=0):
+		if overlap != 0:
+			self.output = self.output[:overlap] + line
+		else:
+			self.output += line
+
+def run(output, lines):
+	start = time.time()
+	for i in xrange(lines):
+		output.write('\t\t<img src="image%d.png">\n' % i)
+		output.write(' />\n', -2)
+	return time.time() - start
+
+def main():
+	naive = '--naive' in sys.argv
+	print '%10s %12s %14s' % ('lines', 'seconds', 'usec/line'),
+	print naive and '%12s %14s' % ('naive sec', 'naive usec') or ''
+	for lines in SIZES:
+		parser = Parser({})
+		elapsed = run(parser, lines)
+		print '%10d %12.4f %14.3f' % (lines, elapsed, elapsed / lines * 1e6),
+		if naive and lines <= NAIVE_LIMIT:
+			elapsed = run(NaiveOutput(), lines)
+			print '%12.4f %14.3f' % (elapsed, elapsed / lines * 1e6)
+		else:
+			print
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+"""
+Runs the synthetic workloads from workloads.py through Parser.parse (some also through Parser.stream), along
+with markuploader.load for the bundled grammars, reporting wall time, lines/sec, output bytes/sec and peak
+memory of each. Results can be saved as a baseline and later runs compared against it, so that slowdowns show
+up before they get merged.
+
+Usage: python benchmarks/run.py [--scale 0.5] [--repeat 5] [--save base.json] [--compare base.json] [NAME ...]
+
+Peak memory comes from tracemalloc (Python-level allocations) when it's available, otherwise each workload
+is measured in a fresh process and the growth of its peak RSS is reported.
+"""
+
+import os, sys, time, json, shutil, tempfile
+import argparse
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import markuploader
+from rapydml.compiler import Parser
+from workloads import WORKLOADS, generate
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+RAPYDML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rapydml')
+GRAMMARS = ['html', 'html5']
+STREAMED = ['wide_siblings', 'large_loop']	# also measured through Parser.stream, whose memory shouldn't grow
+
+def prepare(names, scale, directory):
+	# writes the workloads into directory, returns list of (name, kind, argument, number of lines)
+	cases = []
+	for name in names:
+		size = max(1, int(WORKLOADS[name][1] * scale))
+		source = generate(name, size)
+		path = os.path.join(directory, name + '.pyml')
+		with open(path, 'w') as page:
+			page.write(source)
+		cases.append((name, 'parse', path, source.count('\n')))
+		if name in STREAMED:
+			cases.append(('stream:' + name, 'stream', path, source.count('\n')))
+	for markup in GRAMMARS:
+		with open(os.path.join(RAPYDML_DIR, 'markup', markup)) as grammar:
+			cases.append(('load:' + markup, 'load', markup, sum(1 for line in grammar)))
+	return cases
+
+def run_case(kind, argument):
+	# runs a single measurement, returns size of the produced output (used for bytes/sec)
+	if kind == 'load':
+		markuploader.schemas.clear() # we want the schema read every time, not the in-process copy
+		markuploader.load(argument, RAPYDML_DIR)
+		return 0
+	elif kind == 'stream':
+		# count the output without holding on to it, as a consumer writing it out would
+		parser = Parser(markuploader.load('html', RAPYDML_DIR))
+		sizes = []
+		with open(argument) as source:
+			for chunk in parser.stream(source, argument, os.path.dirname(argument),
+										sink=lambda chunk: sizes.append(len(chunk))):
+				pass
+		return sum(sizes)
+	return len(Parser(markuploader.load('html', RAPYDML_DIR)).parse(argument))
+
+def peak_memory(kind, argument):
+	# returns peak memory in KB used by one run of the case
+	if tracemalloc is not None:
+		tracemalloc.start()
+		try:
+			run_case(kind, argument)
+			return tracemalloc.get_traced_memory()[1] / 1024
+		finally:
+			tracemalloc.stop()
+	import resource
+	before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	run_case(kind, argument)
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+	if sys.platform == 'darwin':
+		peak /= 1024 # reported in bytes rather than KB
+	return peak
+
+def isolated_peak_memory(args):
+	return peak_memory(*args)
+
+def measure(case, repeat):
+	# returns dictionary of metrics for the case, time is the best of `repeat` runs
+	name, kind, argument, lines = case
+	best = None
+	for i in range(repeat):
+		start = time.time()
+		size = run_case(kind, argument)
+		elapsed = time.time() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	if tracemalloc is not None:
+		peak = peak_memory(kind, argument)
+	else:
+		# peak RSS never goes down, so every measurement needs a process of its own
+		pool = multiprocessing.Pool(1)
+		try:
+			peak = pool.apply(isolated_peak_memory, [(kind, argument)])
+		finally:
+			pool.close()
+			pool.join()
+	best = max(best, 1e-9)
+	return {
+		'seconds'		: best,
+		'lines'			: lines,
+		'lines_per_sec'	: lines / best,
+		'bytes_per_sec'	: size / best,
+		'peak_kb'		: peak,
+	}
+
+def report(results, baseline=None, threshold=10.0):
+	# prints results table, returns names of cases that got slower than baseline by more than threshold percent
+	memory = tracemalloc is not None and 'peak KB' or 'RSS growth KB'
+	header = '%-18s %10s %8s %12s %14s %12s' % ('case', 'seconds', 'lines', 'lines/sec', 'out bytes/sec', memory)
+	if baseline:
+		header += ' %10s' % 'vs base'
+	print header
+	regressions = []
+	for name in sorted(results):
+		result = results[name]
+		line = '%-18s %10.4f %8d %12.0f %14.0f %12d' % (name, result['seconds'], result['lines'],
+						result['lines_per_sec'], result['bytes_per_sec'], result['peak_kb'])
+		if baseline:
+			if name in baseline:
+				change = (result['seconds'] / baseline[name]['seconds'] - 1) * 100
+				line += ' %+9.1f%%' % change
+				if change > threshold:
+					regressions.append(name)
+					line += '  SLOWER'
+			else:
+				line += ' %10s' % 'new'
+		print line
+	return regressions
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmarks RapydML compiler on synthetic workloads.')
+	parser.add_argument('names', metavar='NAME', nargs='*',
+						help='Workloads to run (%s), all by default' % ', '.join(sorted(WORKLOADS)))
+	parser.add_argument('--scale', type=float, default=1.0,
+						help='Multiplier for the default size of each workload')
+	parser.add_argument('--repeat', type=int, default=5,
+						help='Number of runs of each case, the fastest one gets reported')
+	parser.add_argument('--save', metavar='FILE',
+						help='Save results as JSON, to be used as baseline by later runs')
+	parser.add_argument('--compare', metavar='FILE',
+						help='Compare results against baseline JSON saved by an earlier run')
+	parser.add_argument('--threshold', metavar='PERCENT', type=float, default=10.0,
+						help='Slowdown against baseline that counts as a regression')
+	args = parser.parse_args()
+
+	for name in args.names:
+		if name not in WORKLOADS:
+			parser.error("Unknown workload '%s'" % name)
+
+	baseline = None
+	if args.compare:
+		with open(args.compare) as source:
+			baseline = json.load(source)['results']
+
+	directory = tempfile.mkdtemp(prefix='rapydml-bench')
+	try:
+		results = {}
+		for case in prepare(args.names or sorted(WORKLOADS), args.scale, directory):
+			results[case[0]] = measure(case, args.repeat)
+	finally:
+		shutil.rmtree(directory)
+
+	regressions = report(results, baseline, args.threshold)
+	if args.save:
+		with open(args.save, 'w') as output:
+			json.dump({'python': sys.version.split()[0], 'scale': args.scale, 'results': results},
+						output, indent=1, sort_keys=True)
+	if regressions:
+		print
+		print '%d case(s) slower than baseline by more than %g%%: %s' % (len(regressions), args.threshold,
+																		', '.join(regressions))
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
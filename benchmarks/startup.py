@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Measures how long bin/rapydml takes to compile a trivial page, from starting the interpreter until the
+output is written, next to the time of starting a bare interpreter. Most of the difference is spent
+importing modules, --imports shows where, in the style of python -X importtime.
+
+Usage: python benchmarks/startup.py [--repeat 20] [--imports]
+"""
+
+import os, sys, time, shutil, tempfile
+import argparse
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SCRIPT = os.path.join(ROOT, 'bin', 'rapydml')
+PAGE = 'div(.trivial):\n\t"hello"\n'
+
+def time_command(command, repeat, env):
+	# returns sorted wall times of running command `repeat` times
+	times = []
+	for i in range(repeat):
+		start = time.time()
+		subprocess.check_call(command, env=env)
+		times.append(time.time() - start)
+	return sorted(times)
+
+def trace_imports(argv):
+	# runs bin/rapydml with an import hook, printing self and cumulative time of every module it imports
+	import __builtin__
+	original_import = __builtin__.__import__
+	stack = [[0.0]]	# time spent in nested imports, for each import in progress
+	records = []
+
+	def loaded_modules():
+		# implicit relative imports leave None entries behind for names they didn't find, those don't count
+		return len([module for module in sys.modules.values() if module is not None])
+
+	def timed_import(name, *args, **kwargs):
+		loaded = loaded_modules()
+		stack.append([0.0])
+		start = time.time()
+		try:
+			return original_import(name, *args, **kwargs)
+		finally:
+			elapsed = time.time() - start
+			nested = stack.pop()[0]
+			if loaded_modules() > loaded:
+				# only count imports that actually loaded something
+				records.append((elapsed - nested, elapsed, len(stack) - 1, name))
+				stack[-1][0] += elapsed
+
+	sys.argv = [SCRIPT] + argv
+	__builtin__.__import__ = timed_import
+	try:
+		execfile(SCRIPT, {'__name__': '__main__', '__file__': SCRIPT})
+	except SystemExit:
+		pass
+	finally:
+		__builtin__.__import__ = original_import
+	print >> sys.stderr, 'import time: self [us] | cumulative | imported package'
+	for own, cumulative, depth, name in records:
+		print >> sys.stderr, 'import time: %9d | %10d | %s%s' % (own * 1e6, cumulative * 1e6, '  ' * depth, name)
+
+def main():
+	parser = argparse.ArgumentParser(description='Measures startup time of the RapydML command line tool.')
+	parser.add_argument('--repeat', type=int, default=20, help='Number of runs, fastest and median get reported')
+	parser.add_argument('--imports', action='store_true', default=False,
+						help='Also show how long each imported module took to load')
+	parser.add_argument('--trace-imports', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+	args = parser.parse_args()
+	if args.trace_imports is not None:
+		trace_imports(args.trace_imports)
+		return
+
+	env = dict(os.environ)
+	env['PYTHONPATH'] = os.pathsep.join([ROOT] + [path for path in [env.get('PYTHONPATH')] if path])
+	directory = tempfile.mkdtemp(prefix='rapydml-startup')
+	try:
+		page = os.path.join(directory, 'trivial.pyml')
+		with open(page, 'w') as source:
+			source.write(PAGE)
+		command = [sys.executable, SCRIPT, '--no-daemon', page]
+		subprocess.check_call(command, env=env) # warm up the schema and the OS caches
+		interpreter = time_command([sys.executable, '-c', 'pass'], args.repeat, env)
+		compile = time_command(command, args.repeat, env)
+		print '%-26s %10s %10s' % ('', 'fastest ms', 'median ms')
+		print '%-26s %10.1f %10.1f' % ('bare interpreter', interpreter[0] * 1000, interpreter[len(interpreter) / 2] * 1000)
+		print '%-26s %10.1f %10.1f' % ('time to first output', compile[0] * 1000, compile[len(compile) / 2] * 1000)
+		print '%-26s %10.1f' % ('rapydml overhead', (compile[0] - interpreter[0]) * 1000)
+		if args.imports:
+			print
+			sys.stdout.flush()
+			subprocess.check_call([sys.executable, os.path.abspath(__file__), '--trace-imports', '--no-daemon', page],
+									env=env)
+	finally:
+		shutil.rmtree(directory)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Compiles the same set of pages serially and then many times over on a thread pool, checking that every
+concurrent compile produces exactly the serial output. Pages live in separate directories that each have
+their own version of the same module, so resolving an import (or running a code_block) relative to the
+wrong page shows up as a mismatch. Also checks that the working directory of the process never changes.
+
+Usage: python benchmarks/threads.py [--threads 8] [--rounds 10] [--scale 0.05]
+"""
+
+import os, sys, time, shutil, tempfile
+import argparse
+from multiprocessing.pool import ThreadPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import markuploader
+from rapydml.compiler import Parser
+from workloads import WORKLOADS, generate
+
+RAPYDML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rapydml')
+SITES = 4
+
+def write(path, source):
+	if not os.path.isdir(os.path.dirname(path)):
+		os.makedirs(os.path.dirname(path))
+	with open(path, 'w') as page:
+		page.write(source)
+
+def prepare(directory, scale):
+	# writes pages into directory, returns their paths
+	sources = []
+	for site in range(SITES):
+		root = os.path.join(directory, 'site%d' % site)
+		write(os.path.join(root, 'common.pyml'), '\n'.join([
+			'$site := %d' % site,
+			'def banner($text):',
+			'\tdiv(.banner, id="site$site"):',
+			'\t\th1($text)',
+		]) + '\n')
+		write(os.path.join(root, 'motto.txt'), 'motto of site %d\n' % site)
+		path = os.path.join(root, 'index.pyml')
+		write(path, '\n'.join([
+			'import common',
+			'import lib.django',
+			'stamp = code_block(pre, \' | cat motto.txt -\')',
+			'body:',
+			'\tbanner("Welcome to $site")',
+			'\tp(django.var(user.name))',
+			'\tstamp:',
+			'\t\tcompiled concurrently',
+		]) + '\n')
+		sources.append(path)
+	for name in sorted(WORKLOADS):
+		path = os.path.join(directory, name + '.pyml')
+		write(path, generate(name, max(1, int(WORKLOADS[name][1] * scale))))
+		sources.append(path)
+	return sources
+
+def compile_page(path):
+	# every compile gets a parser of its own, parsers aren't meant to be shared between threads
+	return Parser(markuploader.load('html', RAPYDML_DIR)).parse(path)
+
+def main():
+	parser = argparse.ArgumentParser(description='Checks that concurrent compiles match serial ones.')
+	parser.add_argument('--threads', type=int, default=8, help='Number of threads in the pool')
+	parser.add_argument('--rounds', type=int, default=10, help='Number of times every page gets compiled')
+	parser.add_argument('--scale', type=float, default=0.05,
+						help='Multiplier for the default size of each workload')
+	args = parser.parse_args()
+
+	cwd = os.getcwd()
+	directory = tempfile.mkdtemp(prefix='rapydml-threads')
+	try:
+		sources = prepare(directory, args.scale)
+		start = time.time()
+		expected = dict((path, compile_page(path)) for path in sources)
+		serial = time.time() - start
+
+		jobs = sources * args.rounds
+		pool = ThreadPool(args.threads)
+		try:
+			start = time.time()
+			outputs = pool.map(compile_page, jobs)
+			concurrent = time.time() - start
+		finally:
+			pool.close()
+			pool.join()
+	finally:
+		shutil.rmtree(directory)
+
+	mismatches = sorted(set(path for path, output in zip(jobs, outputs) if output != expected[path]))
+	print '%d pages, %d compiles on %d threads: serial %.3fs per round, concurrent %.3fs per round' % (
+			len(sources), len(jobs), args.threads, serial, concurrent / args.rounds)
+	failed = False
+	if mismatches:
+		failed = True
+		print 'output differs from serial compile for: %s' % ', '.join(
+				os.path.relpath(path, directory) for path in mismatches)
+	if os.getcwd() != cwd:
+		failed = True
+		print 'working directory changed to %s' % os.getcwd()
+	if failed:
+		sys.exit(1)
+	print 'all outputs match'
+
+if __name__ == '__main__':
+	main()
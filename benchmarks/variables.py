@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Microbenchmark for variable substitution: compares the single-pass substitute_variables() against the
+previous approach that built a new regex for every variable occurrence.
+
+Usage: python benchmarks/variables.py [iterations]
+"""
+
+import os, re, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml.compiler import substitute_variables
+
+def old_replace_variables(code, var_hash):
+	# the original implementation, kept here for comparison
+	vars = re.findall('(?<!\\\\)\$[A-Za-z_][A-Za-z0-9_]*', code)
+	for var in vars:
+		code = re.sub('(?<!\\\\)\%s(?![A-Za-z0-9_])' % var, var_hash[var], code)
+	return code
+
+VARIABLES = dict(('$var%d' % i, 'value%d' % i) for i in range(200))
+
+LINES = {
+	'no variables'	: 'div(class="content", id="main", style="width: 100px; height: 20px")',
+	'2 variables'	: 'img(src="$var1.png", alt="Navigate to $var2")',
+	'dense (40)'	: ' '.join('$var%d' % i for i in range(40)),
+	'dense (200)'	: ', '.join('x=$var%d' % i for i in range(200)),
+}
+
+def timeit(function, line, iterations):
+	start = time.time()
+	for i in xrange(iterations):
+		function(line, VARIABLES)
+	return time.time() - start
+
+def main():
+	iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+	print '%-15s %14s %14s %10s' % ('line', 'old usec/line', 'new usec/line', 'speedup')
+	for name in sorted(LINES):
+		line = LINES[name]
+		assert old_replace_variables(line, VARIABLES) == substitute_variables(line, VARIABLES)
+		old = timeit(old_replace_variables, line, iterations)
+		new = timeit(substitute_variables, line, iterations)
+		print '%-15s %14.2f %14.2f %9.1fx' % (name, old / iterations * 1e6, new / iterations * 1e6, old / new)
+
+if __name__ == '__main__':
+	main()
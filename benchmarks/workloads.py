@@ -0,0 +1,116 @@
+"""
+Generators for synthetic .pyml pages, each one stresses a different part of the compiler. Every generator
+takes a size and returns the page source, WORKLOADS maps workload names to (generator, default size).
+
+Usage: python benchmarks/workloads.py NAME [SIZE]	(prints the generated page)
+"""
+
+import sys
+
+
+def deep_nesting(depth):
+	# a single chain of nested elements, exercises indentation handling and the element stack
+	lines = []
+	for level in range(depth):
+		tag = level % 2 and 'span' or 'div'
+		lines.append('%s%s(id="n%d", .level%d):' % ('\t' * level, tag, level, level))
+	lines.append('%s"innermost text"' % ('\t' * depth))
+	return '\n'.join(lines) + '\n'
+
+def wide_siblings(count):
+	# a long flat list of elements with attributes, the most common shape of real pages
+	lines = ['ul(id="list"):']
+	for i in range(count):
+		lines.append('\tli(.item, id="item%d", title="Item number %d"):' % (i, i))
+		lines.append('\t\ta(href="/items/%d.html"):' % i)
+		lines.append('\t\t\t"Item %d"' % i)
+	return '\n'.join(lines) + '\n'
+
+def large_loop(iterations):
+	# one loop with a small body, exercises loop unrolling and variable substitution
+	return '\n'.join([
+		'$prefix := row',
+		'table:',
+		'\tfor $i in [1:%d]:' % iterations,
+		'\t\ttr(.$prefix, id="$prefix-$i"):',
+		'\t\t\ttd($i)',
+		'\t\t\ttd(.wide, $i)',
+	]) + '\n'
+
+def methods(calls):
+	# many method definitions, each called repeatedly, with arithmetic and color math in the bodies
+	definitions = max(1, calls / 50)
+	lines = ['$base := 10']
+	for i in range(definitions):
+		lines.extend([
+			'def widget%d($text, $size):' % i,
+			'\t$width := $size * 2 + $base',
+			'\t$shade := #202020 + #%06x' % (i * 0x010101 % 0xffffff),
+			'\tdiv(.widget, .w%d, style="width: $width", color=$shade):' % i,
+			'\t\tspan(.label):',
+			'\t\t\t$text',
+		])
+	lines.append('body:')
+	for i in range(calls):
+		lines.append('\twidget%d("Widget %d", %d)' % (i % definitions, i, i % 100))
+	return '\n'.join(lines) + '\n'
+
+def verbatim(blocks):
+	# verbatim and code_block sections, code_block runs each block through a shell command
+	lines = [
+		'javascript = verbatim(script(type="text/javascript"))',
+		'shout = code_block(pre, \' | tr a-z A-Z\')',
+		'$name := "benchmark"',
+		'body:',
+	]
+	for i in range(blocks):
+		lines.extend([
+			'\tjavascript($name):',
+			'\t\tfunction handler%d(event) {' % i,
+			'\t\t\tconsole.log($name, %d, event);' % i,
+			'\t\t}',
+		])
+		if i % 10 == 0:
+			# keep the number of subprocesses reasonable
+			lines.extend([
+				'\tshout:',
+				'\t\tblock %d gets shouted' % i,
+				'\t\tsecond line of block %d' % i,
+			])
+	return '\n'.join(lines) + '\n'
+
+def template_engines(rows):
+	# Django and Jinja2 logic from the bundled lib modules, embedded in attributes and contents of tags
+	lines = [
+		'import lib.django',
+		'import lib.jinja2',
+		'div(.content):',
+	]
+	for i in range(rows):
+		lines.extend([
+			'\tdiv(.row, id=django.var(row%d.id)):' % i,
+			'\t\tp(django.var(row%d.title))' % i,
+			'\t\tspan(jinja2.extends(row%d), django.print(row%d.author))' % (i, i),
+			'\t\ta(href=django.var(row%d.url)):' % i,
+			'\t\t\t"Read more"',
+		])
+	return '\n'.join(lines) + '\n'
+
+WORKLOADS = {
+	'deep_nesting'		: (deep_nesting, 500),
+	'wide_siblings'		: (wide_siblings, 5000),
+	'large_loop'		: (large_loop, 5000),
+	'methods'			: (methods, 2000),
+	'verbatim'			: (verbatim, 500),
+	'template_engines'	: (template_engines, 2000),
+}
+
+def generate(name, size=None):
+	# returns source of the named workload, scaled to given size (or its default size)
+	generator, default_size = WORKLOADS[name]
+	return generator(size or default_size)
+
+if __name__ == '__main__':
+	if len(sys.argv) < 2 or sys.argv[1] not in WORKLOADS:
+		sys.exit('Usage: python benchmarks/workloads.py {%s} [SIZE]' % ','.join(sorted(WORKLOADS)))
+	sys.stdout.write(generate(sys.argv[1], len(sys.argv) > 2 and int(sys.argv[2]) or None))
@@ -0,0 +1,5 @@
+__version__ = '0.0.1'
+
+from api import compile_string, compile_file, compile_stream, compile_events, compile_tree, compile_python, \
+	compile_render, create_parser
+from util import ParserError, CompileError
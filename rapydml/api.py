@@ -0,0 +1,116 @@
+"""
+Interface for compiling pages from other Python code. Unlike bin/rapydml, nothing here prints or exits: the
+compiled markup is returned, and failures raise CompileError (a ParserError) recording the file and line
+where compilation failed. The compiler never changes the working directory, so pages can be compiled from
+several threads at once as long as each thread uses a parser of its own.
+"""
+
+import os
+from util import ParserError, CompileError
+
+
+RAPYDML_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def create_parser(markup='html', search_path=(), command_cache=None, minify=False, slots=False):
+	# returns a parser for given markup, modules get imported from search_path directories when they aren't
+	# found relative to the page, before falling back to rapydml directory, with minify set the parser
+	# leaves out indentation and line breaks, except inside of verbatim blocks, pre, textarea and script,
+	# slots allows slot() variables, whose values only get filled in by the render function of the page
+	# markuploader keeps grammars in memory, so only the first parser for each markup pays for loading it
+	# the compiler gets imported here rather than at the top, importing rapydml alone should stay cheap
+	from markuploader import load
+	from compiler import Parser
+	try:
+		valid_tags = load(markup, RAPYDML_DIR)
+	except (IOError, OSError):
+		raise ParserError("Unknown markup '%s'" % markup)
+	return Parser(valid_tags, command_cache, search_path=search_path, minify=minify, slots=slots)
+
+def run(compile, filename, *args):
+	# invokes parser method compile, errors that don't know where they happened (such as unterminated
+	# blocks at the end of the page) get attributed to filename
+	try:
+		return compile(*args)
+	except CompileError:
+		raise
+	except ParserError as error:
+		raise CompileError(error.message, filename, None, None)
+
+def compile_string(source, markup='html', search_path=(), filename='<string>', directory=None, parser=None,
+					minify=False):
+	# compiles page source and returns the output, imports are looked up relative to directory (current
+	# directory by default), then in search_path, filename is what errors refer to the page as
+	# a parser returned by create_parser can be passed in to skip setting up a new one for every call, it
+	# then decides whether the output gets minified
+	if parser is None:
+		parser = create_parser(markup, search_path, minify=minify)
+	return run(parser.parse_string, filename, source, filename, directory)
+
+def compile_file(filename, markup='html', search_path=(), parser=None, minify=False):
+	# compiles given .pyml file and returns the output, imports are looked up relative to the file first
+	if parser is None:
+		parser = create_parser(markup, search_path, minify=minify)
+	return run(parser.parse, filename, os.path.abspath(filename))
+
+def compile_python(filename, markup='html', search_path=(), parser=None, minify=False):
+	# compiles given .pyml file into source of a Python module with a render(**context) function, which
+	# returns the page with its slot() variables set to the values passed to it (see render.py)
+	# a parser passed in has to be created with slots set
+	from render import build_module
+	if parser is None:
+		parser = create_parser(markup, search_path, minify=minify, slots=True)
+	return build_module(run(parser.parse, filename, os.path.abspath(filename)), os.path.basename(filename))
+
+def compile_render(filename, markup='html', search_path=(), parser=None, minify=False):
+	# same as compile_python, but returns the render function itself, for serving pages without writing
+	# modules to disk
+	from render import load
+	return load(compile_python(filename, markup, search_path, parser, minify)).render
+
+def compile_stream(lines, sink=None, markup='html', search_path=(), filename='<stream>', directory=None,
+					parser=None, chunk_size=None, minify=False):
+	# compiles page read lazily from lines (any iterable, such as an open file or sys.stdin), writing the
+	# output to sink as it's produced and returning the number of bytes written, without a sink an iterator
+	# over output chunks gets returned instead (usable as a WSGI response body)
+	# output that was already passed on stays there if the compilation fails later on
+	if parser is None:
+		parser = create_parser(markup, search_path, minify=minify)
+	options = {}
+	if chunk_size:
+		options['chunk_size'] = chunk_size
+	if sink is None:
+		return attribute_errors(parser.stream(lines, filename, directory, **options), filename)
+	sizes = []
+	def write(chunk):
+		sink.write(chunk)
+		sizes.append(len(chunk))
+	for chunk in attribute_errors(parser.stream(lines, filename, directory, sink=write, **options), filename):
+		pass # chunks go straight to the sink
+	return sum(sizes)
+
+def compile_events(lines, markup='html', search_path=(), filename='<stream>', directory=None, parser=None):
+	# compiles page read lazily from lines, returning an iterator over (kind, data) events describing the
+	# page rather than its text (see events.py), events get produced as the lines are read
+	if parser is None:
+		parser = create_parser(markup, search_path)
+	return attribute_errors(parser.iterevents(lines, filename, directory), filename)
+
+def compile_tree(filename, markup='html', search_path=(), parser=None, root=None):
+	# compiles given .pyml file into an xml.etree.ElementTree element, root names the element a page with
+	# more than one top-level element gets wrapped in
+	from events import build_tree
+	path = os.path.abspath(filename)
+	with open(path, 'r') as source:
+		return run(build_tree, filename, compile_events(source, markup, search_path, path, os.path.dirname(path),
+													parser), root)
+
+def attribute_errors(chunks, filename):
+	# passes the chunks on, reporting errors the same way run does
+	try:
+		for chunk in chunks:
+			if chunk:
+				yield chunk
+	except CompileError:
+		raise
+	except ParserError as error:
+		raise CompileError(error.message, filename, None, None)
@@ -0,0 +1,152 @@
+import os, glob, time, traceback
+
+from util import ParserError, CompileError
+
+
+ACKNOWLEDGEMENT = '<!-- This page has been auto-generated using RapydML (http://www.pyjeon.com) -->\n'
+
+def find_sources(inputs):
+	# expands the list of inputs into .pyml files to compile, each input can be a file, a directory
+	# (searched recursively), a glob pattern, or @file containing one input per line
+	sources = []
+	for item in inputs:
+		if item.startswith('@'):
+			with open(item[1:], 'r') as listing:
+				sources.extend(find_sources([line.strip() for line in listing if line.strip()]))
+		elif os.path.isdir(item):
+			for dirpath, dirnames, filenames in os.walk(item):
+				dirnames.sort()
+				for name in sorted(filenames):
+					if name.endswith('.pyml'):
+						sources.append(os.path.join(dirpath, name))
+		elif os.path.isfile(item):
+			sources.append(item)
+		else:
+			matches = sorted(glob.glob(item))
+			if not matches:
+				raise IOError("No such file, directory or pattern: '%s'" % item)
+			sources.extend(find_sources(matches))
+
+	# remove duplicates, keeping the order
+	seen = set()
+	return [path for path in map(os.path.abspath, sources) if path not in seen and not seen.add(path)]
+
+def output_filename(source):
+	return source.rsplit('.', 1)[0] + '.html'
+
+def write_output(source, compiled, acknowledge=True, compression=None, python=False):
+	# writes compiled page next to its source, returns number of bytes written
+	# compression (a compress.Compression) has precompressed variants written along with it
+	# with python set, the page gets written as a module rendering it (page.py) instead
+	if python:
+		from render import build_module
+		if acknowledge:
+			compiled = ACKNOWLEDGEMENT + compiled
+		with open(source.rsplit('.', 1)[0] + '.py', 'w') as output:
+			output.write(build_module(compiled, os.path.basename(source)))
+			return output.tell()
+	if compression is None:
+		output = open(output_filename(source), 'w')
+	else:
+		output = compression.open(output_filename(source))
+	with output:
+		if acknowledge:
+			output.write(ACKNOWLEDGEMENT)
+		output.write(compiled)
+		return output.tell()
+
+# state of a worker process, set up once by init_worker so that the markup is only loaded once per worker
+worker = {}
+
+def init_worker(markup, location, acknowledge, cache=None, prelude=(), prelude_dir=None, minify=False,
+				compression=None, python=False):
+	# the CLI uses this module for finding sources even when a daemon compiles them, so the compiler
+	# only gets imported once there is something to compile
+	from markuploader import load
+	from compiler import Parser
+	worker['markup_file'] = os.path.join(location, 'markup', markup)
+	worker['parser'] = Parser(load(markup, location), cache is not None and cache.commands or None, minify=minify,
+							slots=python)
+	worker['acknowledge'] = acknowledge
+	worker['compression'] = compression
+	worker['python'] = python
+	worker['cache'] = cache
+	worker['snapshot'] = None
+	worker['prelude_error'] = None
+	if prelude:
+		# prelude modules get compiled once per worker, every page starts from a copy of the result
+		# failing here would kill the worker, so the error gets reported for every page instead
+		try:
+			worker['snapshot'] = worker['parser'].compile_prelude(prelude, prelude_dir)
+		except CompileError as error:
+			worker['prelude_error'] = 'Failed compiling prelude: %s\n%r' % (error, error.line)
+		except ParserError as error:
+			worker['prelude_error'] = 'Failed compiling prelude: %s' % error
+		except Exception:
+			worker['prelude_error'] = 'Failed compiling prelude\n%s' % traceback.format_exc()
+
+def compile_source(source):
+	# compiles a single file inside of a worker, returns (source, bytes written, seconds, error message)
+	start = time.time()
+	if worker['prelude_error'] is not None:
+		return source, 0, 0.0, worker['prelude_error']
+	try:
+		compiled = None
+		cache = worker['cache']
+		if cache is not None:
+			compiled = cache.lookup(source, worker['markup_file'])
+		if compiled is None:
+			parser = worker['parser']
+			compiled = parser.parse(source, snapshot=worker['snapshot'])
+			if cache is not None:
+				cache.save(source, worker['markup_file'], compiled, parser.imported_paths)
+		size = write_output(source, compiled, worker['acknowledge'], worker['compression'], worker['python'])
+		return source, size, time.time() - start, None
+	except CompileError as error:
+		return source, 0, time.time() - start, '%s\n%r' % (error, error.line)
+	except ParserError as error:
+		return source, 0, time.time() - start, str(error)
+	except Exception:
+		return source, 0, time.time() - start, traceback.format_exc()
+
+def compile_batch(sources, markup, location, jobs=None, acknowledge=True, cache=None, callback=None, prelude=(),
+					minify=False, compression=None, python=False):
+	# compiles all sources, spreading them across `jobs` worker processes (defaults to number of CPUs)
+	# a failing file does not stop the batch, returns list of results in the format of compile_source
+	# callback, if given, gets invoked with every result as soon as it's available
+	# prelude modules are looked up relative to current directory, and implicitly imported by every page
+	import multiprocessing
+	if jobs is None:
+		jobs = multiprocessing.cpu_count()
+	jobs = max(1, min(jobs, len(sources)))
+	initargs = (markup, location, acknowledge, cache, tuple(prelude), os.getcwd(), minify, compression, python)
+	results = []
+	if jobs == 1:
+		init_worker(*initargs)
+		iterator = (compile_source(source) for source in sources)
+		pool = None
+	else:
+		pool = multiprocessing.Pool(jobs, init_worker, initargs)
+		iterator = pool.imap_unordered(compile_source, sources)
+	try:
+		for result in iterator:
+			results.append(result)
+			if callback is not None:
+				callback(result)
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+	return results
+
+def summarize(results, elapsed):
+	# returns human-readable report of the batch, failures get listed at the end
+	failed = [result for result in results if result[3] is not None]
+	total_bytes = sum(result[1] for result in results)
+	lines = ['Compiled %d of %d files, %d bytes in %.2fs' % (len(results) - len(failed), len(results), total_bytes, elapsed)]
+	if failed:
+		lines.append('')
+		lines.append('%d file(s) failed:' % len(failed))
+		for source, size, seconds, error in sorted(failed):
+			lines.append('%s:\n\t%s' % (source, error.rstrip().replace('\n', '\n\t')))
+	return '\n'.join(lines)
@@ -0,0 +1,185 @@
+import os, errno, glob, hashlib
+import cPickle as pickle
+from client import DEFAULT_CACHE_DIR, DEFAULT_MAX_SIZE
+
+
+SCAN_INTERVAL = 1000	# writes after which the cache directory gets scanned again, even if it seems to fit
+RAPYDML_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def hash_string(*parts):
+	# returns hex digest of given strings, parts are length-prefixed so that ('ab', 'c') != ('a', 'bc')
+	digest = hashlib.sha1()
+	for part in parts:
+		digest.update('%d:' % len(part))
+		digest.update(part)
+	return digest.hexdigest()
+
+# digests of files we already hashed, validated by modification time and size
+file_hashes = {}
+
+def hash_file(filename):
+	# returns hex digest of file contents, or None if the file can't be read
+	path = os.path.abspath(filename)
+	try:
+		with open(path, 'rb') as source:
+			stat = os.fstat(source.fileno())
+			key = (stat.st_mtime, stat.st_size)
+			try:
+				cached_key, digest = file_hashes[path]
+				if cached_key == key:
+					return digest
+			except KeyError:
+				pass
+			digest = hash_string(source.read())
+	except (IOError, OSError):
+		return None
+	file_hashes[path] = (key, digest)
+	return digest
+
+def compiler_hash():
+	# returns digest of the compiler's own sources, so that entries compiled by a different version of the
+	# code (even an unreleased one) are never reused
+	return hash_string(*[hash_file(path) or '' for path in sorted(glob.glob(os.path.join(RAPYDML_DIR, '*.py')))])
+
+class DiskCache:
+	"""
+	Helper class for storing strings on disk under a string key, the total size of the cache is kept under
+	max_size by evicting least recently used entries, the directory only gets scanned once the size this
+	process estimates goes over max_size (or every SCAN_INTERVAL writes, to notice what other processes
+	wrote), rather than on every write
+	"""
+
+	def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+		self.directory = os.path.abspath(directory or DEFAULT_CACHE_DIR)
+		self.max_size = max_size
+		self.size = None	# estimated size of the entries, None until the directory gets scanned
+		self.writes = 0		# writes since the last scan
+		try:
+			os.makedirs(self.directory)
+		except OSError as error:
+			if error.errno != errno.EEXIST:
+				raise
+
+	def path(self, key):
+		return os.path.join(self.directory, hash_string(key))
+
+	def get(self, key):
+		# returns stored data, or None if there is no entry for the key
+		path = self.path(key)
+		try:
+			with open(path, 'rb') as entry:
+				data = entry.read()
+			os.utime(path, None) # mark entry as recently used
+			return data
+		except (IOError, OSError):
+			return None
+
+	def set(self, key, data):
+		# stores the data, writing to a temporary file first so that readers never see partial entries
+		import tempfile # not needed by runs that only read from the cache
+		fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+		try:
+			with os.fdopen(fd, 'wb') as entry:
+				entry.write(data)
+			os.rename(tmp_path, self.path(key))
+		except:
+			os.remove(tmp_path)
+			raise
+		self.writes += 1
+		if self.size is not None:
+			self.size += len(data) # overwritten entries get counted twice, that only makes the next scan come sooner
+		if self.size is None or self.size > self.max_size or self.writes >= SCAN_INTERVAL:
+			self.evict()
+
+	def evict(self):
+		# removes least recently used entries until the cache fits within max_size
+		entries = []
+		total = 0
+		for name in os.listdir(self.directory):
+			if name.startswith('.tmp'):
+				continue
+			path = os.path.join(self.directory, name)
+			try:
+				stat = os.stat(path)
+			except OSError:
+				continue # removed by another process
+			entries.append((stat.st_mtime, stat.st_size, path))
+			total += stat.st_size
+		self.writes = 0
+		if total > self.max_size:
+			entries.sort()
+			for mtime, size, path in entries:
+				try:
+					os.remove(path)
+				except OSError:
+					pass
+				total -= size
+				if total <= self.max_size:
+					break
+		self.size = total
+
+class CommandCache:
+	"""
+	Stores output of code_block shell commands keyed by the command, the text fed to it and the directory
+	it runs in. A hit doesn't run the command at all, so whatever else it does (such as writing files)
+	doesn't happen either.
+	"""
+
+	def __init__(self, store):
+		self.store = store
+
+	def key(self, command, text, directory=None):
+		return hash_string('command', command, text, os.path.abspath(directory or os.getcwd()))
+
+	def lookup(self, command, text, directory=None):
+		# returns output of a previous run, or None if the command wasn't run on this text in this directory
+		return self.store.get(self.key(command, text, directory))
+
+	def save(self, command, text, output, directory=None):
+		self.store.set(self.key(command, text, directory), output)
+
+class CompileCache:
+	"""
+	Stores compiled output keyed by the contents of the source file, the markup grammar and the compiler
+	sources. Each entry remembers the files pulled in through imports along with their digests, the entry
+	is only reused if none of them changed. Compile options that affect the output, such as the prelude,
+	go in the variant string.
+	"""
+
+	def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE, variant=''):
+		self.store = DiskCache(directory, max_size)
+		self.variant = variant
+		self.version = compiler_hash()
+		self.commands = CommandCache(self.store) # code_block output shares the same space
+
+	def key(self, filename, markup_file):
+		source_hash = hash_file(filename)
+		markup_hash = hash_file(markup_file)
+		if source_hash is None or markup_hash is None:
+			return None
+		return hash_string('compile', self.version, self.variant, os.path.abspath(filename), source_hash, markup_hash)
+
+	def lookup(self, filename, markup_file):
+		# returns previously compiled output, or None if there is no valid entry
+		key = self.key(filename, markup_file)
+		if key is None:
+			return None
+		data = self.store.get(key)
+		if data is None:
+			return None
+		try:
+			dependencies, output = pickle.loads(data)
+		except Exception:
+			return None # corrupted entry, it will get overwritten
+		for path, digest in dependencies:
+			if hash_file(path) != digest:
+				return None
+		return output
+
+	def save(self, filename, markup_file, output, dependencies):
+		# stores compiled output, dependencies are paths of the files that were imported while compiling
+		key = self.key(filename, markup_file)
+		if key is None:
+			return
+		dependencies = [(path, hash_file(path)) for path in dependencies]
+		self.store.set(key, pickle.dumps((dependencies, output), pickle.HIGHEST_PROTOCOL))
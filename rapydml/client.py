@@ -0,0 +1,96 @@
+import os, time
+from util import ParserError
+
+
+# the CLI imports this module on every run, so it should stay cheap to import
+DEFAULT_SOCKET = os.path.join(os.environ.get('TMPDIR') or '/tmp', 'rapydml-%d.sock' % os.getuid())
+CONNECT_TIMEOUT = 2.0	# seconds, a daemon that doesn't accept the connection by then is considered gone
+REPLY_TIMEOUT = 300.0	# seconds without a reply after which the CLI stops waiting and compiles on its own
+
+# defaults of the compile cache (rapydml.cache), kept here so that the CLI's help doesn't have to import it
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'rapydml')
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024	# bytes
+
+def connect(path=None):
+	# returns socket connected to the daemon, or None if no daemon is listening on path
+	path = path or DEFAULT_SOCKET
+	if not os.path.exists(path):
+		return None
+	import socket # deferred until we know there is a daemon, runs without one shouldn't pay for it
+	client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	client.settimeout(CONNECT_TIMEOUT)
+	try:
+		client.connect(path)
+	except socket.error:
+		client.close()
+		return None
+	return client
+
+def request(message, path=None, timeout=REPLY_TIMEOUT):
+	# sends message to the daemon and returns its reply, or None if no daemon is running or it didn't
+	# reply within timeout seconds
+	client = connect(path)
+	if client is None:
+		return None
+	import json, socket
+	client.settimeout(timeout)
+	try:
+		stream = client.makefile('r+b')
+		stream.write(json.dumps(message) + '\n')
+		stream.flush()
+		reply = stream.readline()
+	except socket.error:
+		reply = None
+	finally:
+		client.close()
+	if not reply:
+		return None # daemon went away in the middle of the request
+	reply = json.loads(reply)
+	if 'error' in reply:
+		raise ParserError(reply['error'])
+	return reply
+
+def stop(path=None, timeout=5.0):
+	# shuts down the running daemon and waits for it to exit, returns False if there was none
+	path = path or DEFAULT_SOCKET
+	if request({'command': 'shutdown'}, path) is None:
+		return False
+	deadline = time.time() + timeout
+	while os.path.exists(path) and time.time() < deadline:
+		time.sleep(0.05)
+	return True
+
+def forward(sources, markup, acknowledge=True, cache=None, prelude=(), path=None, minify=False, compression=None,
+			python=False, jobs=None):
+	# asks a running daemon to compile the sources, returns results in the format of batch.compile_source,
+	# or None if there is no daemon so that the caller can compile the sources itself, jobs limits how
+	# many of the daemon's worker processes the sources get spread across
+	settings = None
+	if cache is not None:
+		settings = {'directory': cache.store.directory, 'max_size': cache.store.max_size, 'variant': cache.variant}
+	reply = request({
+		'command'		: 'compile',
+		'sources'		: [os.path.abspath(source) for source in sources],
+		'markup'		: markup,
+		'acknowledge'	: acknowledge,
+		'cache'			: settings,
+		'prelude'		: list(prelude),
+		'prelude_dir'	: os.getcwd(),
+		'minify'		: minify,
+		'compression'	: compression and compression.settings(),
+		'python'		: python,
+		'jobs'			: jobs,
+	}, path)
+	return reply and [tuple(result) for result in reply['results']]
+
+def format_stats(stats):
+	# returns human-readable summary of daemon statistics
+	lines = ['RapydML daemon (pid %d), up %.0fs, %d workers, %d busy' % (stats['pid'], stats['uptime'],
+			stats['workers'], stats['active'])]
+	lines.append('requests: %s' % (', '.join('%s %d' % item for item in sorted(stats['requests'].items())) or 'none'))
+	lines.append('pages compiled: %d, failed: %d' % (stats['pages'], stats['failures']))
+	if 'latency_ms' in stats:
+		latency = stats['latency_ms']
+		lines.append('compile latency (ms): mean %.1f, p50 %.1f, p90 %.1f, p99 %.1f, max %.1f' % (latency['mean'],
+				latency['p50'], latency['p90'], latency['p99'], latency['max']))
+	return '\n'.join(lines)
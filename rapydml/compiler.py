@@ -1,20 +1,23 @@
-import sys, re, os
-import string
-from util import IndentParser, ParserError, ShellError
+import re, os, traceback
+from util import IndentParser, OutputBuffer, Scope, ParserError, ShellError, CompileError
+import reader
+from expression import has_math, evaluate
 from markuploader import NORMAL, SINGLE
-from subprocess import Popen, PIPE
-import pipes
-
-# modules imported for convenience when using python.* within RapydML
-import math
-
+from render import REGEX_SLOT_DECLARATION, slot_marker, check_slots
+import events		# for events.VERBATIM, VERBATIM here is a kind of method body line
+from events import START, END, TEXT, MAX_OVERLAP, TextWriter, split_attribute, render_start_tag
 
 # change this to True to see additional output during compilation
 DEBUG = False
 
+LETTERS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
 
 # variables used by verbatim
 VERBATIM = 1
+LOOP = 2		# method line type for loops nested in methods or other loops
+ASSIGNMENT = 3
+INVALID = 4
 MULTI_LINE = 0
 SINGLE_LINE = 1
 CODE_BLOCK = 2
@@ -24,9 +27,17 @@ METHOD_VARS = 1
 # variables used by regex
 REGEX_NESTED_PAREN = r'\([^()]*(?:\(.*?\))*[^()]*\)'
 NOT_SINGLE_QUOTED = r'^(?:[^\']*([\'])[^\']*\1)*[^\']*'
+REGEX_COLOR_NAME = re.compile('"[A-Za-z]+"(?=(?:(?:[^"]*"){2})*[^"]*$)')
+REGEX_HEX_COLOR = re.compile('#[A-Fa-f0-9]+(?=(?:(?:[^"]*"){2})*[^"]*$)')
+REGEX_CALL = re.compile('^[A-Za-z_][A-Za-z0-9_]*[ ]*\(.*\)')
 
 # miscellaneous
 EOF_MARKER = '!!!_E_O_F_!!!\n'
+PRELUDE = '<prelude>'	# stands in for the importing file while compiling a prelude
+STREAM_CHUNK_SIZE = 8192	# bytes of output Parser.stream collects before passing them on
+BLOCK_SIZE = 64			# most lines Parser.parse_incremental puts into a block it can reuse on its own
+MISSING = object()		# stands in for keys that weren't in a map when a block looked them up
+RAPYDML_DIR = os.path.dirname(os.path.abspath(__file__))	# bundled modules (lib.*) get imported from here
 
 def is_number(s):
 	try:
@@ -39,6 +50,18 @@ def is_valid_name(s):
 	# returns true if name follows Pythonic standard
 	return not not re.match('^[a-zA-Z_][a-zA-Z0-9_]*$', s)
 
+def array_range(start, end, increment=''):
+	# returns lazy sequence for shorthand array, unlike Python's range() the end is inclusive
+	if increment == '':
+		increment = 1
+	else:
+		increment = int(increment)
+	if increment > 0:
+		final = int(end)+1
+	else:
+		final = int(end)-1
+	return xrange(int(start), final, increment)
+
 def expand_arrays(tag):
 	# expands shorthand arrays such as [1:5] into full-array [1,2,3,4,5]
 	# [0:6] 	-> [0,1,2,3,4,5,6]
@@ -47,16 +70,19 @@ def expand_arrays(tag):
 	# [8:1]		-> []
 	matches = re.findall('(\[(-?\d+):(-?\d+)(:(-?\d+))*\])', tag)
 	for array in matches:
-		if array[-1] == '':
-			increment = 1
-		else:
-			increment = int(array[-1])
-		if increment > 0:
-			final = int(array[2])+1
-		else:
-			final = int(array[2])-1
-		tag = tag.replace(array[0], str(range(int(array[1]),final,increment)))
+		tag = tag.replace(array[0], str(list(array_range(array[1], array[2], array[-1]))))
 	return tag
+
+REGEX_ARRAY_SHORTHAND = re.compile(r'^\s*(-?\d+):(-?\d+)(?::(-?\d+))?\s*$')
+
+def parse_loop_array(tag):
+	# returns the sequence a loop iterates over, everything between the first '[' and last ']' of the tag,
+	# shorthand arrays such as [0:100000] are iterated lazily rather than expanded
+	items = tag.split('[', 1)[1].rsplit(']', 1)[0]
+	shorthand = REGEX_ARRAY_SHORTHAND.match(items)
+	if shorthand:
+		return array_range(shorthand.group(1), shorthand.group(2), shorthand.group(3) or '')
+	return [item.strip() for item in get_attr('(%s)' % expand_arrays(items))]
 	
 attr_map = {'.' : 'class'}
 def convert_attr(attr):
@@ -135,23 +161,26 @@ def parse_definition(tag):
 		attributes = []
 	return element, attributes
 		
-def replace_variables(code, var_hash, ignore_list=[]):
-	#plugs the variables into the line
-	vars = re.findall('(?<!\\\\)\$[A-Za-z_][A-Za-z0-9_]*', code)
-	
-	for var in ignore_list:
-		try:
-			vars.remove(var)
-		except ValueError:
-			pass # variable doesn't appear on this line
-	
-	for var in vars:
+REGEX_VARIABLE = re.compile(r'(\\?)(\$[A-Za-z_][A-Za-z0-9_]*)')
+
+def substitute_variables(code, var_hash, only=None, ignore_list=()):
+	# replaces every $name token with its value in a single left-to-right pass, values are inserted as is
+	# escaped variables (\$name) are left alone, if `only` is given, other variables are left alone as well
+	if code.find('$') == -1 or (only is not None and not only):
+		return code
+	def substitute(match):
+		escape, var = match.groups()
+		if escape or var in ignore_list or (only is not None and var not in only):
+			return match.group(0)
 		try:
-			# the first version will not replace 2nd occurence in strings like '$a$a'
-			#code = re.sub('(?<!(\\\\|[A-Za-z0-9_]))\%s(?![A-Za-z0-9_])' % var, var_hash[var], code)
-			code = re.sub('(?<!\\\\)\%s(?![A-Za-z0-9_])' % var, var_hash[var], code)
+			return var_hash[var]
 		except KeyError:
 			raise ParserError("Variable '%s' used prior to definition" % var)
+	return REGEX_VARIABLE.sub(substitute, code)
+
+def replace_variables(code, var_hash, ignore_list=()):
+	#plugs the variables into the line
+	code = substitute_variables(code, var_hash, ignore_list=ignore_list)
 	
 	if code.find('python.') != -1:
 		# use of python method
@@ -176,9 +205,9 @@ def do_arithmetic(operation):
 	# valid color formats we expect are '#ffffff', '#000', or 'white' (note the quotes, we assume them necessary)
 	# what about style?
 	try:
-		result = eval(operation)
+		result = evaluate(operation)
 		return repr(result)
-	except SyntaxError, NameError:
+	except SyntaxError:
 		raise ParserError("Command '%s' is not a valid mathematical operation" % operation.strip())
 
 def parse_array_part(array_part):
@@ -227,47 +256,80 @@ def parse_template_engine_method_declaration(line):
 	method, attributes = parse_definition(command_pair[1])
 	return method_pair[0], method_pair[1], method, attributes
 
-def create_tag(element, attributes):
-	attr_string = ' '.join(attributes)
-	if attr_string:
-		starttag = '<%s %s>\n' % (element, attr_string)
-	else:
-		starttag = '<%s>\n' % element
-	endtag = '</%s>\n' % element
-	return starttag, endtag
+def split_attributes(element, attributes):
+	# returns attributes of element as (name, value) pairs, the way START events carry them
+	attributes = [split_attribute(attribute.replace('\$', '$')) for attribute in attributes]
+	check_slots(element, attributes)
+	return attributes
 
 def eval_python(line):
 	substrings = re.findall(r'(\bpython\..*?%s)' % REGEX_NESTED_PAREN, line)
 	for substring in substrings:
-		mystr = repr(eval(substring[7:]))
+		mystr = repr(evaluate(substring[7:]))
 		line = line.replace(substring, mystr)
 	return line
 
+def run_code_block(command, text, cache=None, directory=None):
+	# runs code_block command with the text on its STDIN, returns (STDOUT, STDERR) of the command
+	# the command runs in given directory (current one by default)
+	# commands are written to follow the text, i.e. ' | tr a-z A-Z' or ' > /tmp/file && ...', if it's a pipe
+	# the text goes straight to the piped command, otherwise we let cat do the redirection
+	text += '\n'
+	if cache is not None:
+		output = cache.lookup(command, text, directory)
+		if output is not None:
+			return output, ''
+	if command.lstrip()[:1] == '|' and command.lstrip()[:2] != '||':
+		shell_command = command.lstrip()[1:]
+	else:
+		shell_command = 'cat' + command
+	from subprocess import Popen, PIPE # most pages never run a command, so don't pay for it at startup
+	output, error = Popen(shell_command, stdin=PIPE, stdout=PIPE, stderr=PIPE, shell=True,
+							cwd=directory).communicate(text)
+	if cache is not None and not error:
+		cache.save(command, text, output, directory)
+	return output, error
+
+def resolve_module(module, directories):
+	# returns (directory, path) for the first of directories that contains the module, or None
+	# lookups aren't cached: checking that a cached module is still there and that no earlier directory
+	# gained the module since (which matters to the daemon and watch mode) costs as much as looking again
+	relative = os.path.join(*module.split('.')) + '.pyml'
+	for directory in directories:
+		path = os.path.join(directory, relative)
+		if os.path.isfile(path):
+			return directory, path
+	return None
+
 class ColorConverter:
 	"""
 	Helper class for handling color conversion, so that we can perform math operations on it
 	"""
 
-	def __init__(self):
-		# create a map for html color names
-		self.color_map = {}
-		orig_dir = os.getcwd()
-		cur_dir = os.path.dirname(__file__)
-		os.chdir(os.path.abspath(cur_dir))
-		with open('html_colors.txt', 'r') as input:
-			for line in input:
-				pair = line.split(':')
-				self.color_map[pair[0]] = pair[1].rstrip()
-		os.chdir(orig_dir)
+	def __init__(self, filename=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'html_colors.txt')):
+		# map of html color names, read from filename the first time it's needed and never modified after
+		self.filename = filename
+		self.color_map = None
+	
+	def get_color_map(self):
+		if self.color_map is None:
+			color_map = {}
+			with open(self.filename, 'r') as input:
+				for line in input:
+					pair = line.split(':')
+					color_map[pair[0]] = pair[1].rstrip()
+			self.color_map = color_map
+		return self.color_map
 	
 	def is_color(self, color_string):
-		return color_string in self.color_map.keys()
+		return color_string in self.get_color_map()
 	
 	def to_num(self, color):
 		# first we standardize colors to 6-digit hex format
 		color = color.lower()
-		if color in self.color_map.keys():
-			color = self.color_map[color]
+		color_map = self.get_color_map()
+		if color in color_map:
+			color = color_map[color]
 		elif len(color) == 3:
 			color = '%s%s%s%s%s%s' % (color[0], color[0], color[1], color[1], color[2], color[2])
 		elif len(color) != 6:
@@ -279,45 +341,72 @@ class ColorConverter:
 	def to_color(self, num):
 		return hex(num)[2:].zfill(6)
 
+# color table is the same for every parser, so they all share one converter
+COLORS = ColorConverter()
+
+# results of color arithmetic such as '"red" + #001', keyed by the expression
+MAX_COLOR_COMPUTATIONS = 10000
+color_computations = {}
+
 class Method:
 	"""
 	Helper class for generating html-creating methods
 	"""
 	
-	def __init__(self, attributes, copy_heap, color_parser, name):
+	def __init__(self, attributes, copy_heap, color_parser, name, source=None):
 		# create a new method that can be invoked later
 		# attributes: set of parameters this method will take in (this will be defined at function invocation)
-		# heap: the memory space this method sees
-		#	can be used to hide some vaiables from a method or 'shadow' global variables by passing copies
+		# copy_heap: if set, variables assigned inside the method shadow the globals rather than overwriting them
+		# source: (filename, line number) of the definition, lines added to the method should have one too
 		self.attributes = attributes
+		self.source = source
 		self.lines = []
 		self.color = color_parser
 		self.copy_heap = copy_heap
 		self.name = name
 		self.local_vars = []
+		self.constant_lines = {} # evaluated lines that don't depend on any variables
 	
-	def add_line(self, line, verbatim=None, verbatim_vars=[]):
-		# this is where we handle replacing predefined variables
+	def add_line(self, line, verbatim=None, verbatim_vars=[], source=None):
+		# lines get split into assignments and output when the method is defined, rather than on every call
 		if verbatim is None:
-			line_type = NORMAL
 			trash, line = expand_assignment(line)
-			if line.find(':=') != -1:
+			assignments = line.count(':=')
+			if assignments == 1:
 				operands = line.split(':=')
 				self.local_vars.append(operands[0].strip())
+				self.lines.append((ASSIGNMENT, operands[0].strip(), operands[1].strip(), source))
+			elif assignments > 1:
+				self.lines.append((INVALID, line, None, source))
+			else:
+				# lines without variables or python calls always evaluate the same
+				is_constant = line.find('$') == -1 and line.find('python.') == -1
+				self.lines.append((NORMAL, line, is_constant, source))
 		else:
-			line_type = VERBATIM
-		self.lines.append((line_type, line, verbatim_vars))
+			self.lines.append((VERBATIM, line, verbatim_vars, source))
+	
+	def add_loop(self, indent, loop_name, array, source=None):
+		# nested loop, gets executed every time this method runs
+		self.lines.append((LOOP, (indent, loop_name, array), None, source))
+	
+	def definition(self):
+		# returns everything calls to the method depend on, which leaves out where its lines came from
+		return (self.name, self.attributes, self.copy_heap, [line[:3] for line in self.lines])
 	
 	def eval_chunk(self, part):
-		if re.search('[-+*/](?=(?:(?:[^"]*"){2})*[^"]*$)', part) and \
-		re.search("[-+*/](?=(?:(?:[^']*'){2})*[^']*$)", part):
+		if has_math(part):
+			try:
+				return color_computations[part]
+			except KeyError:
+				pass
+			expression = part
 			
 			# check for potential colors:
 			# check for "blue" etc
 			# check for #fff etc
 			is_color_computation = False
-			possible_colors = re.findall('"[A-Za-z]+"(?=(?:(?:[^"]*"){2})*[^"]*$)', part)
-			possible_hex_colors = re.findall('#[A-Fa-f0-9]+(?=(?:(?:[^"]*"){2})*[^"]*$)', part)
+			possible_colors = REGEX_COLOR_NAME.findall(part)
+			possible_hex_colors = REGEX_HEX_COLOR.findall(part)
 			for color in possible_colors:
 				color = color[1:-1]
 				if self.color.is_color(color):
@@ -339,15 +428,18 @@ class Method:
 			if is_color_computation:
 				part = max(min(int(part), 0xffffff), 0x000000)
 				part = '#%s' % self.color.to_color(part)
+				if len(color_computations) >= MAX_COLOR_COMPUTATIONS:
+					color_computations.clear()
+				color_computations[expression] = part
 		return part
 	
-	def eval_line(self, line):
+	def eval_line(self, line, heap):
 		# returns evaluated version of the line
-		line = replace_variables(line, self.heap)
+		line = replace_variables(line, heap)
 		
 		#TEMP: this tester is naive, it assumes the strings will not contain ' or " characters inside of them
 		#BUG: we need to resolve things like div(#tag-id,#f00+#001)
-		if re.search('^[A-Za-z_][A-Za-z0-9_]*[ ]*\(.*\)', line.strip()):
+		if REGEX_CALL.search(line.strip()):
 			whitespace = line.split(line.strip()[0])[0]
 			element, attributes = parse_definition(line)
 			for i in range(len(attributes)):
@@ -357,42 +449,39 @@ class Method:
 			line = self.eval_chunk(line)
 		return line
 	
-	def run_method(self, args, heap):
+	def run_method(self, args, heap, on_line=None):
+		# method calls get their own scope layered over the heap, loops (copy_heap unset) write to it directly
+		# on_line, if given, gets invoked with source of each line before the line is evaluated
 		if self.copy_heap:
-			self.heap = heap.copy()
-		else:
-			self.heap = heap
+			heap = Scope(heap)
 		#var_hash = {} #if we 'clutter' the global heap, it makes some logic easier and allows more Python-like reuse of variables after loop terminates
-		for i in range(len(self.attributes)):
-			#TEMP: the \ replacing is a temporary quickfix for misunderstood problem of Python interpreting the string when it shouldn't
-			#var_hash[self.attributes[i]] = args[i].replace('\\','\\\\')
-			try:
-				self.heap[self.attributes[i]] = args[i].replace('\\','\\\\')
-			except IndexError:
-				raise ParserError("Method '%s' expects %s attributes, %s given." % \
-									(self.name, len(self.attributes), len(args)))
-		for line in self.lines:
-			if line[0] == VERBATIM:
-				verbatim_line = line[1]
-				
-				# replace variables we specified
-				for variable in line[2]:
-					verbatim_line = re.sub(r'\%s(?![A-Za-z0-9_])' % variable, self.heap[variable], verbatim_line)
-				
-				yield verbatim_line		# don't run any logic on verbatim lines
-			else:
-				line = line[1]
-				
-				# this is where we handle replacing method arguments
-				assignments = line.count(':=')
-				if assignments == 1:
-					operands = line.split(':=')
-					self.heap[operands[0].strip()] = self.eval_line(operands[1].strip())
-					yield None # this line produces no output
-				elif assignments > 1:
-					raise "Multiple assignments on same line aren't allowed"
+		if len(args) < len(self.attributes):
+			raise ParserError("Method '%s' expects %s attributes, %s given." % \
+								(self.name, len(self.attributes), len(args)))
+		for name, value in zip(self.attributes, args):
+			heap[name] = value
+		for line_type, line, extra, source in self.lines:
+			if on_line is not None:
+				on_line(source)
+			if line_type == NORMAL:
+				if extra:
+					try:
+						yield self.constant_lines[line]
+					except KeyError:
+						self.constant_lines[line] = self.eval_line(line, heap)
+						yield self.constant_lines[line]
 				else:
-					yield self.eval_line(line)
+					yield self.eval_line(line, heap)
+			elif line_type == ASSIGNMENT:
+				heap[line] = self.eval_line(extra, heap)
+				yield None # this line produces no output
+			elif line_type == VERBATIM:
+				# replace variables we specified, don't run any logic on verbatim lines
+				yield substitute_variables(line, heap, extra)
+			elif line_type == LOOP:
+				yield line	# executed by the parser
+			else:
+				raise ParserError("Multiple assignments on same line aren't allowed")
 
 class TemplateEngine:
 	"""
@@ -460,6 +549,202 @@ class TemplateEngine:
 			return None
 		else:
 			return self.tag_format % self.methods[method][2]
+	
+	def fork(self):
+		# returns a copy with the same methods that can be extended and called without affecting this one
+		engine = TemplateEngine(self.tag_format[:-1])
+		for name, (start_format, num_vars, end_format, submethods) in self.methods.items():
+			engine.methods[name] = (start_format, num_vars, end_format, list(submethods))
+		return engine
+	
+	def state(self):
+		# returns everything calls to the engine depend on, in a form that can be compared and restored
+		methods = tuple((name, start_format, num_vars, end_format, tuple(submethods))
+						for name, (start_format, num_vars, end_format, submethods) in sorted(self.methods.items()))
+		return (self.tag_format, methods, tuple(self.method_stack))
+
+def restore_engine(state):
+	# returns TemplateEngine in the state returned by TemplateEngine.state
+	tag_format, methods, method_stack = state
+	engine = TemplateEngine(tag_format[:-1])
+	for name, start_format, num_vars, end_format, submethods in methods:
+		engine.methods[name] = (start_format, num_vars, end_format, list(submethods))
+	engine.method_stack = list(method_stack)
+	return engine
+
+class Snapshot:
+	"""
+	Parser state captured after compiling a prelude (modules shared by many pages), pages compiled from
+	it start out with the variables, methods, template engines and verbatim tags the prelude defined,
+	as if they imported the prelude modules themselves
+	"""
+	
+	def __init__(self, parser):
+		self.modules = tuple(parser.imported_files)
+		self.var_map = dict(parser.var_map)
+		self.method_map = dict(parser.method_map)
+		self.loop_index = parser.loop_index
+		self.template_engines = dict((name, engine.fork()) for name, engine in parser.template_engines.items())
+		self.verbatim = dict(parser.verbatim)
+		self.imported_paths = tuple(parser.imported_paths)
+		self.import_graph = dict((path, tuple(imported)) for path, imported in parser.import_graph.items()
+									if path != PRELUDE)
+		self.prelude_paths = tuple(parser.import_graph.get(PRELUDE, ()))
+		self.module_paths = dict(parser.module_paths)
+		self.indent_marker = parser.tree.indent_marker
+		self.output = parser.output.getvalue()
+		self.last_output = parser.writer.last_output
+	
+	def fork(self, parser):
+		# gives parser its own copy of the state, the snapshot itself never changes so it can be reused
+		parser.imported_files = list(self.modules)
+		parser.var_map = dict(self.var_map)
+		parser.method_map = dict(self.method_map)
+		parser.loop_index = self.loop_index
+		parser.template_engines = dict((name, engine.fork()) for name, engine in self.template_engines.items())
+		parser.verbatim = dict(self.verbatim)
+		parser.imported_paths = list(self.imported_paths)
+		parser.import_graph = dict((path, list(imported)) for path, imported in self.import_graph.items())
+		parser.module_paths = dict(self.module_paths)
+		parser.tree.indent_marker = self.indent_marker
+		parser.output.write(self.output)
+		parser.writer.last_output = self.last_output
+
+class RecordingDict(dict):
+	"""
+	Dictionary that records which keys get looked up and assigned, incremental compiles use it for var_map
+	and method_map to find out which variables and methods each block of the page depends on and defines
+	"""
+	
+	def __init__(self, items=()):
+		dict.__init__(self, items)
+		self.start()
+	
+	def start(self):
+		# starts recording from scratch, for the next block
+		self.reads = {}			# key -> value it had when first looked up (MISSING if absent)
+		self.written = set()
+		self.complete = True	# unset when the map gets looked at as a whole, reads then don't cover it
+	
+	def read(self, key):
+		# values assigned by the block itself aren't something it depends on
+		if key not in self.written and key not in self.reads:
+			self.reads[key] = dict.get(self, key, MISSING)
+	
+	def __getitem__(self, key):
+		self.read(key)
+		return dict.__getitem__(self, key)
+	
+	def __contains__(self, key):
+		self.read(key)
+		return dict.__contains__(self, key)
+	
+	has_key = __contains__
+	
+	def get(self, key, default=None):
+		self.read(key)
+		return dict.get(self, key, default)
+	
+	def __setitem__(self, key, value):
+		self.written.add(key)
+		dict.__setitem__(self, key, value)
+	
+	def __delitem__(self, key):
+		self.written.add(key)
+		dict.__delitem__(self, key)
+	
+	def pop(self, key, *default):
+		self.read(key)
+		self.written.add(key)
+		return dict.pop(self, key, *default)
+	
+	def setdefault(self, key, default=None):
+		self.read(key)
+		self.written.add(key)
+		return dict.setdefault(self, key, default)
+	
+	def update(self, *args, **kwargs):
+		changes = dict(*args, **kwargs)
+		self.written.update(changes)
+		dict.update(self, changes)
+	
+	def changes(self):
+		# returns values of keys written since start(), MISSING for deleted ones
+		return dict((key, dict.get(self, key, MISSING)) for key in self.written)
+	
+	def unchanged(self, reads):
+		# checks that keys still have the values recorded in reads
+		for key, value in reads.items():
+			if not same_value(value, dict.get(self, key, MISSING)):
+				return False
+		return True
+	
+	def apply(self, changes):
+		# writes changes returned by changes() without recording them
+		for key, value in changes.items():
+			if value is MISSING:
+				dict.pop(self, key, None)
+			else:
+				dict.__setitem__(self, key, value)
+
+def read_whole(name):
+	# wraps dict method that looks at all of the entries
+	method = getattr(dict, name)
+	def wrapper(self, *args):
+		self.complete = False
+		return method(self, *args)
+	wrapper.__name__ = name
+	return wrapper
+
+for name in ('keys', 'values', 'items', 'iterkeys', 'itervalues', 'iteritems', 'copy', '__iter__', '__len__'):
+	setattr(RecordingDict, name, read_whole(name))
+
+def same_value(old, new):
+	# variables are strings, methods get compared by what they do, since a method defined in a block that
+	# had to be compiled again is a new object even if the definition didn't change
+	if old is new:
+		return True
+	if isinstance(old, Method) and isinstance(new, Method):
+		return old.definition() == new.definition()
+	return old == new
+
+class Block:
+	"""
+	Record of a block of a page compiled by Parser.parse_incremental: its source, the state it started
+	from, the variables and methods it read along with their values, and its effect (output, variables
+	and methods it assigned, state it left behind), a later compile of the page splices the effect in
+	rather than compiling the block again if all of its inputs are the same
+	"""
+	
+	def __init__(self, key, state, loop_index, start, overlap):
+		self.key = key				# source of the first unit, blocks get looked up by it
+		self.source = []			# source of each unit the block consists of
+		self.state = state			# Parser.block_state() the block started from
+		self.loop_index = loop_index
+		self.start = start			# position of output the block's output starts at
+		self.overlap = overlap		# characters of output preceding the block that it can rewrite
+		self.reusable = False
+	
+	def finish(self, parser, state):
+		# records effect of the block, state is Parser.block_state() it left behind, None if the parser is
+		# in the middle of something (a method definition, loop or verbatim block) when the block ends
+		self.exit = state
+		self.loop_exit = parser.loop_index
+		self.reusable = state is not None and not parser.volatile \
+						and parser.var_map.complete and parser.method_map.complete
+		if self.reusable:
+			self.output = parser.output.tail(len(parser.output) - self.start)
+			self.var_reads = parser.var_map.reads
+			self.method_reads = parser.method_map.reads
+			self.var_changes = parser.var_map.changes()
+			self.method_changes = parser.method_map.changes()
+	
+	def matches(self, parser, units, index, state):
+		# checks whether the block can be reused at given index of units, parser being in given state
+		return self.state == state \
+			and [source for lines, source in units[index:index + len(self.source)]] == self.source \
+			and (self.loop_exit == self.loop_index or self.loop_index == parser.loop_index) \
+			and parser.var_map.unchanged(self.var_reads) and parser.method_map.unchanged(self.method_reads)
 
 class Parser:
 	"""
@@ -476,11 +761,22 @@ class Parser:
 		'code_block'
 	]
 	
-	def __init__(self, valid_tags):
+	def __init__(self, valid_tags, command_cache=None, profiler=None, search_path=(), minify=False, slots=False):
 		self.valid_tags = valid_tags
+		self.command_cache = command_cache	# cache.CommandCache for code_block output, if any
+		self.profiler = profiler			# profiler.Profiler recording where compile time goes, if any
+		self.search_path = tuple(map(os.path.abspath, search_path)) # directories to import modules from
+		self.directory = None		# directory imports and code_block commands are relative to, cwd if None
+		self.minify = minify		# leave out indentation and line breaks the markup doesn't need
+		self.slots = slots			# allow slot() variables, filled in when the page gets rendered (see render.py)
+		if profiler is not None:
+			profiler.attach(self)
 		self.tree = IndentParser()
-		self.element_stack = []
-		self.output = ''
+		self.element_stack = []		# (element, indent, end tag) closing each level of indentation writes, element
+									# is None for template engine methods, the entry None if there's nothing to close
+		self.output = OutputBuffer()
+		self.writer = TextWriter(self.output, minify)
+		self.events = None			# list collecting events in place of text output, see iterevents
 		self.last_opened_element = None
 		self.var_map = {}
 		
@@ -490,8 +786,13 @@ class Parser:
 		self.loop_index = 0
 		
 		self.template_engines = {}
-		self.color = ColorConverter()
+		self.color = COLORS
 		self.imported_files = []
+		self.imported_paths = []	# absolute paths of imported files, the compiled output depends on them
+		self.import_graph = {}		# absolute path of each parsed file -> paths of files it imports directly
+		self.module_paths = {}		# module name -> absolute path of the file it was imported from
+		self.current_file = None
+		self.current_source = None	# (filename, line number) of the line being compiled
 		
 		self.verbatim = {}
 		self.current_verbatim = None
@@ -499,6 +800,15 @@ class Parser:
 		self.verbatim_buffer = ''
 		self.verbatim_vars = ([], [])
 		self.need_to_remove_method_vars = False
+		
+		self.blocks = []		# Block records of the last incremental compile
+		self.reused_blocks = 0
+		self.volatile = False	# set when output depends on more than the parser state (files, commands)
+	
+	def get_directory(self):
+		# the working directory is shared by the whole process, so the parser never changes it, instead
+		# paths get resolved against the directory of the page being compiled
+		return self.directory or os.getcwd()
 	
 	def get_debug_state(self):
 		# method used for debugging
@@ -513,14 +823,13 @@ class Parser:
 		print "tree.no_stack", self.tree.no_stack
 		print "^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^"
 	
-	def write(self, line, overlap = 0):
-		# helper method for writing to file, all writes should be done through it to ensure a single point
-		# of entry
-		line = line.replace('\$', '$')
-		if overlap != 0:
-			self.output = self.output[:overlap] + line
+	def event(self, kind, data):
+		# all output goes through here as events (see events.py), they get written out as text unless
+		# iterevents is collecting them
+		if self.events is not None:
+			self.events.append((kind, data))
 		else:
-			self.output += line
+			self.writer.write(kind, data)
 	
 	def resolve_indexes(self, line):
 		# replace all indexes with corresponding values
@@ -546,6 +855,7 @@ class Parser:
 			
 		if tag is None:
 			return # this is not an element that requires closing
+		element, indent, endtag = tag	# element is None for ending logic of template engine methods
 		
 		# in order to use short-hand <tag /> we need to make sure that tag is not a special tag, 
 		# and that the name matches as well as indent
@@ -559,14 +869,19 @@ class Parser:
 					tag_type = self.valid_tags['*'][0]
 				except KeyError:
 					# WE SHOULD NOT GET IN HERE UNLESS SOMETHING IS WRONG
-					print "This logic should not trigger, please inform RapydML developers, provide the contents of your .pyml file as well."
-					raise ParserError("'%s' is not a valid markup tag or method name." % self.last_opened_element)
+					raise ParserError("'%s' is not a valid markup tag or method name. This logic should not trigger, "
+						"please inform RapydML developers, provide the contents of your .pyml file as well."
+						% self.last_opened_element)
 		
-		if tag_type == NORMAL \
-		and re.search('^%s</%s>' % (self.tree.indent_to(self.tree.indent), self.last_opened_element), tag):
-			self.write(' />\n', -2)
-		elif tag_type != SINGLE or self.last_opened_element is None:
-			self.write(tag)
+		self_closing = element is not None and tag_type == NORMAL \
+		and re.search('^%s</%s>' % (self.tree.indent_to(self.tree.indent), self.last_opened_element), indent + endtag) \
+		is not None
+		if tag_type == SINGLE and self.last_opened_element is not None or self_closing:
+			endtag = ''
+		if element is not None:
+			self.event(END, (element, indent, endtag.replace('\$', '$'), self_closing))
+		elif endtag:
+			self.event(TEXT, (indent, endtag.replace('\$', '$')))
 				
 	
 	def set_variable(self, tag):
@@ -576,13 +891,18 @@ class Parser:
 			raise ParserError("You're trying to declare variable %s without assignment" % vars[0].strip())
 			
 		text = vars[-1].lstrip()
+		slot = REGEX_SLOT_DECLARATION.match(text.strip())
+		if slot and not self.slots:
+			raise ParserError("slot() variables only work when compiling the page to a Python module (--python)")
 		for var in vars[:-1]:
-			if var[0] == '$':
+			if var[0] == '$' and slot:
+				self.var_map[var.rstrip()] = slot_marker(var.strip()[1:], slot.group(1))
+			elif var[0] == '$':
 				self.var_map[var.rstrip()] = self.get_variables(text)
 			else:
 				raise ParserError("Illegal assignment to a constant '%s'" % var.rstrip())
 	
-	def get_variables(self, tag, ignore_list=[]):
+	def get_variables(self, tag, ignore_list=()):
 		# applies variables from the system to current line
 		tag = replace_variables(tag, self.var_map, ignore_list)
 		return self.resolve_indexes(tag) # this converts notation [item1, item2, item3, ...][1] to item2
@@ -593,15 +913,15 @@ class Parser:
 			self.tree.indent = indent
 			element, attributes = parse_definition(line[4:])
 			
-			if element[0] not in string.letters + '_' or not (element.replace('_','').isalnum()):
+			if element[0] not in LETTERS + '_' or not (element.replace('_','').isalnum()):
 				raise ParserError("Method name must be alphanumeric with underscores and start with a letter or underscore")
 			
-			if element in self.valid_tags.keys():
+			if element in self.valid_tags:
 				raise ParserError("Can't create method named '%s', it's a reserved markup element name" % element)
 			
 			self.creating_method = element
 			# methods access shadowed variables to prevent overwriting globals
-			self.method_map[element] = Method(attributes, True, self.color, element)
+			self.method_map[element] = Method(attributes, True, self.color, element, self.current_source)
 				
 		else:	# regular line inside a method
 			if indent == 0:
@@ -619,21 +939,56 @@ class Parser:
 					# add normal line to method sequence
 					self.method_map[self.creating_method].add_line(line[len(self.tree.indent_marker):], 
 																self.current_verbatim,
-																self.verbatim_vars[METHOD_VARS])
+																self.verbatim_vars[METHOD_VARS],
+																self.current_source)
 		return False
 	
 	def unroll_loop(self):
-		loop_token = self.loop_stack.pop()
-		loop_name = loop_token[0]
-		loop_indent = loop_token[1]
-		loop_array = loop_token[2]
+		loop_name, loop_indent, loop_array = self.loop_stack.pop()
 		self.tree.indent = loop_indent
-		for arg in loop_array:
-			loop_call = '%s%s(%s)' % (self.tree.indent_to(loop_indent), loop_name, arg)
-			if self.creating_method:
-				self.method_map[self.creating_method].add_line(loop_call)
+		while self.loop_stack and self.loop_stack[-1][1] >= loop_indent:
+			# a loop following another one at the same level terminates the previous one
+			self.unroll_loop()
+		if self.creating_method:
+			# loop inside of a method, runs every time the method is called
+			self.method_map[self.creating_method].add_loop(loop_indent, loop_name, loop_array,
+															self.method_map[loop_name].source)
+		elif self.loop_stack:
+			# nested loop, runs on every iteration of the outer loop
+			outer_name, outer_indent = self.loop_stack[-1][:2]
+			self.method_map[outer_name].add_loop(loop_indent-outer_indent-1, loop_name, loop_array,
+												self.method_map[loop_name].source)
+		else:
+			self.run_loop(loop_name, loop_indent, loop_array)
+	
+	def run_loop(self, loop_name, indent, array):
+		# loop body is compiled once as a method, the iterator variable gets bound to each item directly
+		method = self.method_map[loop_name]
+		for item in array:
+			self.call_method(method, [str(item)], indent)
+	
+	def call_method(self, method, args, indent):
+		# runs method at given indent, feeding the lines it generates back into the parser
+		whitespace = self.tree.indent_to(indent)
+		self.handle_indent(indent, None)
+		on_line = None
+		if self.profiler is not None:
+			# work done by generated lines gets charged to the lines of the method that generated them,
+			# running loop bodies counts as time spent in loops rather than methods
+			self.profiler.enter(method.copy_heap and 'methods' or 'loops')
+			caller = self.profiler.line
+			on_line = self.profiler.set_line
+		for method_line in method.run_method(args, self.var_map, on_line):
+			if method_line is None:
+				continue
+			elif isinstance(method_line, tuple):
+				loop_indent, loop_name, array = method_line
+				self.run_loop(loop_name, indent+loop_indent, array)
 			else:
-				self.handle_line(loop_call)
+				self.handle_line(whitespace+method_line)
+		if on_line is not None:
+			self.profiler.restore_line(caller)
+			self.profiler.exit()
 	
 	def handle_indent(self, indent, method_name, no_end=False):
 		if not self.creating_method:
@@ -655,19 +1010,13 @@ class Parser:
 		if tag[:4] == 'for ':	# new loop started (either within old loop, or outside)
 			self.handle_indent(indent, None)
 			var = tag.split()[1] #[for,$var,in,...]
-			if var in self.var_map.keys():
+			if var in self.var_map:
 				raise ParserError("Can't reuse previously defined variable %s as loop iterator" % var)
 			
-			#array = self.get_variables(tag.split('[')[1].split(']')[0]).split(',')
-			#iterator = re.findall('^for[ ]+(\$[a-zA-Z_][a-zA-Z0-9_]*)[ ]+in', tag)[0]
-			#array = self.get_variables(tag, [var]).split('[', 1)[1].rsplit(']', 1)[0].split(',')
-			array = get_attr('(%s)' % self.get_variables(tag, [var]).split('[', 1)[1].rsplit(']', 1)[0])
-			
-			for i in range(len(array)):
-				array[i] = array[i].strip()
+			array = parse_loop_array(self.get_variables(tag, [var]))
 			loop_name = 'rapydml_loop_def_%s' % self.loop_index
 			self.loop_stack.append((loop_name, indent, array))
-			self.method_map[loop_name] = Method([var], False, self.color, loop_name) # loops see/access global var space
+			self.method_map[loop_name] = Method([var], False, self.color, loop_name, self.current_source) # loops see/access global var space
 			self.loop_index += 1
 		else:					# command inside the loop or outside (loop termination)
 			loop_name = self.loop_stack[-1][0]
@@ -679,7 +1028,7 @@ class Parser:
 				self.handle_line(line)
 			else:
 				self.tree.indent = indent
-				self.method_map[loop_name].add_line(line[len(self.tree.indent_to(loop_indent+1)):])
+				self.method_map[loop_name].add_line(line[len(self.tree.indent_to(loop_indent+1)):], source=self.current_source)
 
 	def expand_assignment_ops(self, tag, perform=True):
 		# takes operation of form '$a += 3', converts it to '$a := $a + 3' and evaluates it, assigning new value to $a
@@ -691,33 +1040,39 @@ class Parser:
 		return result
 	
 	def import_module(self, line):
+		self.volatile = True # imported files and the import graph aren't part of the block state
 		tokens = line.split()
 		if len(tokens) != 2 or tokens[0] != 'import':
 			raise ParserError("Invalid import statement: %s" % line.strip())
 		
-		if tokens[1] not in self.imported_files:
-			try:
-				self.imported_files.append(tokens[1])
-				self.parse(tokens[1].replace('.', '/') +'.pyml', True)
-			except IOError:
-				# failed importing from working directory, try importing from rapydml directory
-				cur_dir = os.getcwd()
-				try:
-					# we have to rely on __file__, because cwd could be different if invoked by another script
-					os.chdir(os.path.dirname(__file__))
-					self.imported_files.append(tokens[1])
-					self.parse(tokens[1].replace('.', '/') +'.pyml', True)
-				except IOError:
-					raise ParserError("Can't import '%s', module doesn't exist" % tokens[1])
-				finally:
-					os.chdir(cur_dir)
+		if tokens[1] in self.imported_files:
+			# already imported by another file, we still want to know this file depends on it
+			if tokens[1] in self.module_paths:
+				self.import_graph[self.current_file].append(self.module_paths[tokens[1]])
+			return
+		
+		# look in the directory of the importing file first, then in the search path, then in rapydml directory
+		found = resolve_module(tokens[1], (self.get_directory(),) + self.search_path + (RAPYDML_DIR,))
+		if found is None:
+			raise ParserError("Can't import '%s', module doesn't exist" % tokens[1])
+		
+		# imports inside of the module are relative to the directory it was found in
+		index = len(self.imported_paths)
+		self.imported_files.append(tokens[1])
+		importer_directory, self.directory = self.directory, found[0]
+		try:
+			self.parse(found[1], True)
+		finally:
+			self.directory = importer_directory
+			if len(self.imported_paths) > index:
+				self.module_paths[tokens[1]] = self.imported_paths[index]
 	
 	def create_template_engine(self, line):
 		# creates a new set of rules for a templating engine, such as Django, Web2py, or Rails
 		pair = line.split('=')
 		if len(pair) != 2:
 			raise ParserError("Improper TemplateEngine declaration")
-		elif pair[0].isalnum() and pair[0] not in string.letters:
+		elif pair[0].isalnum() and pair[0] not in LETTERS:
 			raise ParserError("TemplateEngine must have alphanumeric name that starts with a letter")
 		template = pair[1][pair[1].find('(')+1:pair[1].rfind(')')-1].strip().strip("'").strip('"')
 		self.template_engines[pair[0].rstrip()] = TemplateEngine(template)
@@ -772,7 +1127,7 @@ class Parser:
 			if indent is not None:
 				if end_method:
 					# full-line declaration
-					ending_tag = whitespace + end_method
+					ending_tag = (None, whitespace, end_method[:-1])
 				else:
 					# invocation that's a subset of the line
 					ending_tag = None
@@ -800,7 +1155,7 @@ class Parser:
 					self.handle_indent(indent+1, None)
 					self.element_stack.pop()
 				else:
-					self.handle_indent(indent+1, whitespace + endtag)
+					self.handle_indent(indent+1, (None, whitespace, endtag[:-1]))
 			attr = get_attr(line)
 			return whitespace + self.template_engines[method_pair[0]].call_method(method_pair[1], attr, indent)
 			#self.element_stack.append(whitespace + self.template_engines[method_pair[0]].end_method(method_pair[1]))
@@ -843,7 +1198,8 @@ class Parser:
 			#	endtag = '</%s>\n' % attributes[0]
 			
 			tagname, tagattr = parse_definition(attributes[0])
-			starttag, endtag = create_tag(tagname, tagattr)
+			starttag = render_start_tag(tagname, split_attributes(tagname, tagattr)) + '\n'
+			endtag = '</%s>\n' % tagname
 		elif length == 2:
 			# received 2 quoted arguments for beginning and end tags
 			starttag = attributes[0][1:-1] + '\n'
@@ -897,8 +1253,8 @@ class Parser:
 					line = line[self.verbatim_indent+1:]
 				
 					# plug in the variables, if they appear on this line
-					for variable in self.verbatim_vars[GLOBAL_VARS]:
-						line = re.sub(r'\%s(?![A-Za-z0-9_])' % variable, self.var_map[variable], line)
+					if self.verbatim_vars[GLOBAL_VARS]:
+						line = substitute_variables(line, self.var_map, self.verbatim_vars[GLOBAL_VARS])
 					
 					self.verbatim_buffer += line
 			else:
@@ -908,21 +1264,20 @@ class Parser:
 						self.verbatim_buffer = re.sub('\n[ 	]*', ' ', self.verbatim_buffer)
 						self.verbatim_buffer += '\n'
 					elif verbatim_properties[2] == CODE_BLOCK:
-						result = Popen('echo %s' % pipes.quote(self.verbatim_buffer) + verbatim_properties[3],
-										stdout=PIPE, stderr=PIPE, shell=True).communicate()
-						if result[1]:
+						self.volatile = True
+						output, error = run_code_block(verbatim_properties[3], self.verbatim_buffer,
+																self.command_cache, self.get_directory())
+						if error:
 							raise ShellError("'%s' code_block tag triggered the following OS error: %s" %
-											(self.current_verbatim, result[1]))
-						self.verbatim_buffer = result[0] + '\n'
+											(self.current_verbatim, error))
+						self.verbatim_buffer = output + '\n'
 					if verbatim_properties[1] != '':
-						vindent = self.tree.indent_to(self.verbatim_indent)
-						self.verbatim_buffer = '%s%s%s%s%s' % (\
-							vindent,
-							verbatim_properties[0],
-							self.verbatim_buffer,
-							vindent,
-							verbatim_properties[1])
-					self.write(self.verbatim_buffer)
+						starttag = verbatim_properties[0][:-1].replace('\$', '$')
+						endtag = verbatim_properties[1][:-1].replace('\$', '$')
+					else:
+						starttag = endtag = None
+					self.event(events.VERBATIM, (self.tree.indent_to(self.verbatim_indent), starttag,
+											self.verbatim_buffer.replace('\$', '$'), endtag))
 					self.verbatim_buffer = ''
 					self.close_last_element() # close verbatim element so it does not screw up the stack
 				self.current_verbatim = None
@@ -963,8 +1318,10 @@ class Parser:
 			# strip comments and blank lines
 			return
 		
-		line = expand_arrays(line)
-		tag = line.strip()
+		if tag[:4] != 'for ':
+			# loops expand shorthand arrays lazily
+			line = expand_arrays(line)
+			tag = line.strip()
 		
 		# first check is a quick pre-qualifier to avoid expensive regex, second one avoids
 		# false positives like: this_is_not_verbatim_call()
@@ -1036,16 +1393,13 @@ class Parser:
 		if tag[0] in ('"', "'"):
 			# handle quoted strings as plain-text
 			starttag = tag[1:-1] + '\n'
-			element = None
+			element = attributes = None
 			htmlend = None
 		else:
 			# test if this tag is a method call, if so execute it
 			element, attributes = parse_definition(tag)
-			if element in self.method_map.keys():
-				self.handle_indent(indent, None)
-				for method_line in self.method_map[element].run_method(attributes, self.var_map):
-					if method_line is not None:
-						self.handle_line(whitespace+method_line)
+			if element in self.method_map:
+				self.call_method(self.method_map[element], attributes, indent)
 				return
 			else:
 				# this is a regular tag, not a method, let's make sure the element and attributes are valid
@@ -1065,8 +1419,8 @@ class Parser:
 						if attr_name not in self.valid_tags[hash_key][1]:
 							raise ParserError("'%s' is not one of allowed attributes for '%s' element" % (attr_name, hash_key))
 		
-			starttag, endtag = create_tag(element, attributes)
-			htmlend = whitespace + endtag
+			attributes = split_attributes(element, attributes)
+			htmlend = (element, whitespace, '</%s>' % element)
 		
 		# check indent difference, close old tags if indent < 1
 		self.handle_indent(indent, htmlend)
@@ -1075,46 +1429,274 @@ class Parser:
 		self.last_opened_element = element
 		
 		# dump the current line to file
-		self.write(whitespace + starttag)
+		if element is None:
+			self.event(TEXT, (whitespace, starttag[:-1].replace('\$', '$')))
+		else:
+			self.event(START, (element, attributes, whitespace))
+	
+	def emit(self, lines, filename):
+		# runs Line objects (see reader.py) through the compiler in document order, returns the last one
+		last = None
+		for line in lines:
+			if line.blank and self.current_verbatim is None:
+				# these only matter as part of verbatim blocks
+				continue
+			self.current_source = (self.current_file, line.lineno)
+			if self.profiler is not None:
+				self.profiler.set_line(self.current_source)
+			self.guard(filename, line, self.handle_line, line.line)
+			last = line
+		return last
+	
+	def close(self, filename, last):
+		# finishes the file, errors raised on the way (such as by a loop or method the file ends in) get
+		# reported at its last line, last being the Line emit returned
+		self.guard(filename, last or reader.Line('', None), self.finish)
+	
+	def guard(self, filename, line, method, *args):
+		# calls method, turning errors it raises into CompileError at given Line of filename
+		try:
+			method(*args)
+		except CompileError:
+			raise # error inside of an imported file, already has the location
+		except (ParserError, ShellError) as error:
+			if DEBUG:
+				self.get_debug_state()
+				raise error
+			raise CompileError(error.message, filename, line.lineno, line.line)
+		except Exception:
+			# on all other errors
+			if DEBUG:
+				self.get_debug_state()
+				raise
+			raise CompileError("'%s' caused the following uncaught exception:\n%s" % (line.tag, traceback.format_exc()),
+								filename, line.lineno, line.line)
+	
+	def compile_prelude(self, modules, directory=None):
+		# imports given modules into a clean parser and returns the resulting state as a Snapshot, modules
+		# are looked up relative to directory (current directory by default), then in rapydml directory
+		self.__init__(self.valid_tags, self.command_cache, self.profiler, self.search_path, self.minify, self.slots) #reset
+		self.current_file = PRELUDE
+		self.import_graph[PRELUDE] = []
+		self.directory = directory and os.path.abspath(directory)
+		try:
+			for module in modules:
+				self.import_module('import %s' % module)
+		finally:
+			self.current_file = None
+			self.directory = None
+		return Snapshot(self)
 	
-	def parse(self, filename, module=False):
+	def parse(self, filename, module=False, snapshot=None):
 		# we assume here that the file is relatively small compared to our allowed buffer
+		# snapshot, if given, is the state to start from, as returned by compile_prelude
 		if not module:
-			self.__init__(self.valid_tags) #reset
-			os.chdir(os.path.abspath(os.path.dirname(filename)))
-		line_num = 0
-		with open(filename, 'r') as source:
-			buffer = ''
-			for line in source:
-				line_num += 1
-				try:
-					#parse multi-lines together
-					#ignore extra spaces after '\' at the line end 
-					if line.rstrip()[-1:] == '\\':
-						if buffer:
-							line = ' ' + line.lstrip()
-						buffer += line.rstrip()[:-1]
-						continue
-					elif buffer:
-						line = buffer + ' ' + line.lstrip()
-						buffer = ''
-					
-					self.handle_line(line)
-				except (ParserError, ShellError) as error:
-					if DEBUG:
-						self.get_debug_state()
-						raise error
-					print "Error in %s: line %d: %s" % (filename, line_num, error.message)
-					print repr(line)
-					sys.exit()
-				except:
-					# on all other errors
-					if DEBUG:
-						self.get_debug_state()
-					print "Error in %s: line %d: %s" % (filename, line_num, "'%s' caused the following uncaught exception:" % line.strip())
-					print repr(line)
-					raise
-		
+			self.__init__(self.valid_tags, self.command_cache, self.profiler, self.search_path, self.minify, self.slots) #reset
+			if snapshot is not None:
+				snapshot.fork(self)
+			self.directory = os.path.dirname(os.path.abspath(filename))
+		path = os.path.abspath(filename)
+		if module:
+			lines = reader.load(path) # modules get imported by many pages, pages themselves only get read once
+			self.imported_paths.append(path)
+			self.import_graph[self.current_file].append(path)
+			snapshot = None
+		else:
+			lines = reader.read(path)
+		return self.compile_lines(lines, filename, path, snapshot)
+	
+	def parse_string(self, source, filename='<string>', directory=None, snapshot=None):
+		# same as parse, but compiles page given as a string, its imports are looked up relative to directory
+		# (current directory by default), filename is only used to identify the page in errors and profiles
+		self.__init__(self.valid_tags, self.command_cache, self.profiler, self.search_path, self.minify, self.slots) #reset
+		if snapshot is not None:
+			snapshot.fork(self)
+		self.directory = directory and os.path.abspath(directory)
+		return self.compile_lines(reader.iter_lines(source.splitlines(True)), filename, filename, snapshot)
+	
+	def stream(self, lines, filename='<stream>', directory=None, snapshot=None, chunk_size=STREAM_CHUNK_SIZE,
+				sink=None):
+		# same as parse_string, but reads the page from any iterable of lines (such as an open file or stdin)
+		# as it goes, and yields the output in chunks of about chunk_size instead of returning it at the end
+		# neither the lines that were already compiled nor the output passed on are kept in memory
+		# if sink (a callable) is given, chunks go straight to it instead and nothing gets yielded, that way
+		# even a single loop producing lots of output doesn't need to have all of it in memory at once
+		self.__init__(self.valid_tags, self.command_cache, self.profiler, self.search_path, self.minify, self.slots) #reset
+		pending = []
+		self.output.pass_on(sink or pending.append, chunk_size, MAX_OVERLAP)
+		if snapshot is not None:
+			snapshot.fork(self)
+		self.directory = directory and os.path.abspath(directory)
+		self.add_file(filename, snapshot)
+		importer, self.current_file = self.current_file, filename
+		last = None
+		try:
+			for line in reader.iter_lines(lines):
+				last = self.emit((line,), filename) or last
+				while pending:
+					yield pending.pop(0)
+		finally:
+			self.current_file = importer
+		self.close(filename, last)
+		pending.append(self.output.drain())
+		for chunk in pending:
+			if sink is None:
+				yield chunk
+			else:
+				sink(chunk)
+	
+	def iterevents(self, lines, filename='<stream>', directory=None, snapshot=None):
+		# same as stream, but yields (kind, data) events describing the page (see events.py) rather than
+		# its text, events of each line get passed on as soon as the line is compiled
+		self.__init__(self.valid_tags, self.command_cache, self.profiler, self.search_path, self.minify, self.slots) #reset
+		self.events = []
+		if snapshot is not None:
+			snapshot.fork(self)
+		self.directory = directory and os.path.abspath(directory)
+		self.add_file(filename, snapshot)
+		importer, self.current_file = self.current_file, filename
+		last = None
+		try:
+			for line in reader.iter_lines(lines):
+				last = self.emit((line,), filename) or last
+				if self.events:
+					events, self.events = self.events, []
+					for event in events:
+						yield event
+		finally:
+			self.current_file = importer
+		self.close(filename, last)
+		for event in self.events:
+			yield event
+		self.events = None
+	
+	def compile_lines(self, lines, filename, path, snapshot=None):
+		# compiles lines of a page or module, path identifies it in the import graph
+		self.add_file(path, snapshot)
+		importer, self.current_file = self.current_file, path
+		try:
+			last = self.emit(lines, filename)
+		finally:
+			self.current_file = importer
+		self.close(filename, last)
+		return self.output.getvalue()
+	
+	def parse_incremental(self, filename, previous=(), snapshot=None):
+		# same as parse, but reuses output of an earlier compile of the page: previous is what the blocks
+		# attribute held after that compile, blocks whose source and inputs didn't change since get spliced
+		# in rather than compiled again, blocks of the new compile are left in the blocks attribute
+		# blocks are top-level lines with everything nested under them, unless that's more than BLOCK_SIZE
+		# lines, in which case the lines nested under it form blocks of their own, so that even a page wrapped
+		# in a single html element doesn't have to be compiled all over again because of a small edit
+		self.__init__(self.valid_tags, self.command_cache, self.profiler, self.search_path, self.minify, self.slots) #reset
+		if snapshot is not None:
+			snapshot.fork(self)
+		self.directory = os.path.dirname(os.path.abspath(filename))
+		self.var_map = RecordingDict(self.var_map)
+		self.method_map = RecordingDict(self.method_map)
+		path = os.path.abspath(filename)
+		with open(path, 'r') as source:
+			units = reader.split(source, BLOCK_SIZE) # reused blocks don't need to be read line by line
+		self.add_file(path, snapshot)
+		importer, self.current_file = self.current_file, path
+		try:
+			self.compile_blocks(units, filename, previous)
+		finally:
+			self.current_file = importer
+		last = units and units[-1][0][-1] or None # (line number, line, indent)
+		self.close(filename, last and reader.Line(last[1], last[0]))
+		return self.output.getvalue()
+	
+	def compile_blocks(self, units, filename, previous):
+		# compiles units returned by reader.split, grouping them into blocks and splicing in previous blocks that
+		# match, a block ends after the first unit that leaves the parser at a point it can be resumed from
+		# by restoring the state recorded in Block, if none does, the block goes on until the end
+		candidates = {}
+		for block in previous:
+			if block.reusable:
+				candidates.setdefault(block.key, []).append(block)
+		block = None
+		index = 0
+		state = self.block_state()
+		while index < len(units):
+			lines, source = units[index]
+			if state is not None:
+				if block is not None:
+					block.finish(self, state)
+				block = None
+				for candidate in candidates.get(source, ()):
+					if candidate.matches(self, units, index, state):
+						self.splice(candidate)
+						index += len(candidate.source)
+						state = candidate.exit
+						break
+				else:
+					block = self.start_block(source, state)
+				if block is None:
+					continue
+			self.emit([reader.Line(line, line_num) for line_num, line, indent in lines], filename)
+			block.source.append(source)
+			index += 1
+			state = self.block_state()
+		if block is not None:
+			block.finish(self, state)
+	
+	def block_state(self):
+		# returns parser state a block starts from, other than variables and methods, None if the parser
+		# is in the middle of a method definition, loop or verbatim block, blocks don't start there
+		if self.creating_method is not None or self.loop_stack or self.current_verbatim is not None \
+		or self.need_to_remove_method_vars:
+			return None
+		return (
+			tuple(self.element_stack),
+			self.tree.indent,
+			self.tree.no_stack,
+			self.tree.indent_marker,
+			self.last_opened_element,
+			self.output.tail(MAX_OVERLAP), # closing an element can rewrite the end of the previous block
+			tuple(sorted(self.verbatim.items())),
+			tuple((name, engine.state()) for name, engine in sorted(self.template_engines.items())),
+			self.writer.state(),
+		)
+	
+	def start_block(self, key, state):
+		# starts recording a new block
+		self.var_map.start()
+		self.method_map.start()
+		self.volatile = False
+		overlap = len(state[5])
+		block = Block(key, state, self.loop_index, len(self.output) - overlap, overlap)
+		self.blocks.append(block)
+		return block
+	
+	def splice(self, block):
+		# applies effect of a previously compiled block, as if the block was compiled again
+		self.output.write(block.output, -block.overlap)
+		self.var_map.apply(block.var_changes)
+		self.method_map.apply(block.method_changes)
+		self.loop_index = block.loop_exit
+		stack, indent, no_stack, indent_marker, last_opened_element, tail, verbatim, engines, writer = block.exit
+		self.element_stack = list(stack)
+		self.tree.indent = indent
+		self.tree.no_stack = no_stack
+		self.tree.indent_marker = indent_marker
+		self.last_opened_element = last_opened_element
+		self.writer.restore(writer)
+		if verbatim != block.state[6]:
+			self.verbatim = dict(verbatim)
+		if engines != block.state[7]:
+			self.template_engines = dict((name, restore_engine(engine)) for name, engine in engines)
+		self.blocks.append(block)
+		self.reused_blocks += 1
+	
+	def add_file(self, path, snapshot=None):
+		# adds file to the import graph
+		if snapshot is not None:
+			# page depends on the prelude modules just like on the ones it imports
+			self.import_graph[path] = list(snapshot.prelude_paths)
+		self.import_graph.setdefault(path, [])
+	
+	def finish(self):
 		# terminate non-finished loops and pop off remaining elements, closing our HTML tags
 		if self.current_verbatim is not None:
 			self.handle_verbatim_call(EOF_MARKER)
@@ -1124,4 +1706,3 @@ class Parser:
 			self.unroll_loop()
 		while self.element_stack:
 			self.close_last_element()
-		return self.output
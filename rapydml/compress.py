@@ -0,0 +1,109 @@
+import os, zlib
+
+from util import ParserError
+
+
+FORMATS = ('gz', 'zz')		# gzip and zlib streams, written as page.html.gz and page.html.zz
+DEFAULT_LEVEL = 9			# pages get compressed once and served many times, so it pays to compress hard
+DEFAULT_MIN_SIZE = 1024		# bytes, smaller pages don't get precompressed variants
+
+def compressor(format, level):
+	# returns zlib compressor producing given format, gzip header gets neither a file name nor a modification
+	# time, so that the same page always compresses to the same bytes
+	if format == 'gz':
+		return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+	return zlib.compressobj(level)
+
+def update_file(path, data, mode):
+	# replaces the file with data unless it already holds exactly that, so that its modification time only
+	# changes along with the content, returns whether the file got written
+	try:
+		if os.path.getsize(path) == len(data):
+			with open(path, 'rb') as existing:
+				if existing.read() == data:
+					return False
+	except (IOError, OSError):
+		pass # file doesn't exist yet
+	import tempfile # only needed once something changed
+	fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+	try:
+		with os.fdopen(fd, 'wb') as output:
+			output.write(data)
+		os.chmod(tmp_path, mode & 0777) # readable by whoever can read the page itself
+		os.rename(tmp_path, path) # the web server never sees a partially written file
+	except:
+		os.remove(tmp_path)
+		raise
+	return True
+
+class Compression:
+	"""
+	Settings for writing precompressed variants of compiled pages next to them, for web servers that serve
+	page.html.gz in place of page.html to clients accepting gzip (such as nginx with gzip_static)
+	"""
+
+	def __init__(self, formats=('gz',), level=DEFAULT_LEVEL, min_size=DEFAULT_MIN_SIZE):
+		for format in formats:
+			if format not in FORMATS:
+				raise ParserError("Unknown compression format '%s', expected one of: %s" % (format, ', '.join(FORMATS)))
+		if not 0 <= level <= 9:
+			raise ParserError("Compression level must be between 0 and 9")
+		self.formats = tuple(formats)
+		self.level = level
+		self.min_size = min_size
+
+	def settings(self):
+		# returns keyword arguments recreating these settings, in a form that can be sent to the daemon
+		return {'formats': list(self.formats), 'level': self.level, 'min_size': self.min_size}
+
+	def open(self, path):
+		# returns file-like object for writing the page to path, compressing it along the way
+		return CompressedOutput(path, self)
+
+class CompressedOutput:
+	"""
+	Writes the page to a file and feeds everything written to compressors at the same time, compressed
+	variants get saved once the page is closed, unless they didn't change
+	"""
+
+	def __init__(self, path, compression):
+		self.path = path
+		self.file = open(path, 'w')
+		self.min_size = compression.min_size
+		self.compressors = [(format, compressor(format, compression.level), []) for format in compression.formats]
+		self.size = 0
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, type, value, traceback):
+		if type is None:
+			self.close()
+		else:
+			self.file.close() # don't replace compressed variants with those of a partial page
+
+	def write(self, data):
+		self.file.write(data)
+		self.size += len(data)
+		for format, compressor, chunks in self.compressors:
+			chunks.append(compressor.compress(data))
+
+	def tell(self):
+		return self.file.tell()
+
+	def close(self):
+		# returns paths of compressed variants that were written
+		self.file.close()
+		mode = os.stat(self.path).st_mode
+		written = []
+		for format, compressor, chunks in self.compressors:
+			path = '%s.%s' % (self.path, format)
+			if self.size < self.min_size:
+				# a variant left over from when the page was bigger would be served in place of the page
+				if os.path.exists(path):
+					os.remove(path)
+				continue
+			chunks.append(compressor.flush())
+			if update_file(path, ''.join(chunks), mode):
+				written.append(path)
+		return written
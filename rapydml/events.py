@@ -0,0 +1,244 @@
+"""
+Output of the compiler as a stream of events. Everything the compiler outputs goes through Parser.event as
+(kind, data) pairs, Parser.iterevents passes them on to tools that would otherwise parse the generated
+markup again, the text output is TextWriter writing them out:
+
+	(START, (element, attributes, indent))
+		element opened, attributes being a list of (name, value) pairs, value is None for attributes
+		without one, the start tag gets written from them (see render_start_tag)
+	(END, (element, indent, tag, self_closing))
+		element closed, every START gets one, tag is the end tag as it gets written, empty for elements
+		without one (such as input) and for elements closed by turning the start tag into <tag />, which
+		self_closing is set for
+	(TEXT, (indent, text))
+		one line of plain text (or output of a template engine call)
+	(VERBATIM, (indent, starttag, text, endtag))
+		content of a verbatim block, exactly as it appears in the output, along with the tags its
+		declaration wraps it in, None if it has none
+
+indent is the whitespace preceding the line in the text output. Text is passed on as written in the page,
+markup and entities in it don't get parsed.
+"""
+
+import re
+from util import ParserError
+
+
+START = 'start'
+END = 'end'
+TEXT = 'text'
+VERBATIM = 'verbatim'
+
+MAX_OVERLAP = 2			# characters at the end of output that closing an element can still rewrite
+PRESERVE_WHITESPACE = frozenset(['pre', 'textarea', 'script'])	# elements minified output leaves alone inside
+BLOCK_ELEMENTS = frozenset([	# elements whitespace next to doesn't get rendered, minified output leaves it out
+	'address', 'article', 'aside', 'base', 'blockquote', 'body', 'caption', 'col', 'colgroup', 'dd', 'details',
+	'dialog', 'div', 'dl', 'dt', 'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4',
+	'h5', 'h6', 'head', 'header', 'hgroup', 'hr', 'html', 'li', 'link', 'main', 'menu', 'meta', 'nav', 'noscript',
+	'ol', 'optgroup', 'option', 'p', 'pre', 'script', 'section', 'style', 'summary', 'table', 'tbody', 'td',
+	'tfoot', 'th', 'thead', 'title', 'tr', 'ul'])
+OUTPUT_BLOCK = 1		# kinds of what minified output ends with, tags of block-level elements (as well as
+OUTPUT_INLINE = 2		# comments and declarations) don't need line breaks next to them, tags of inline ones do,
+OUTPUT_TEXT = 3			# the line break is a space between them
+
+REGEX_START_TAG = re.compile(r'^<([A-Za-z_][^\s/>]*)((?:\s+[^\s=>]+(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s"\'>]+))?)*)\s*>$')
+REGEX_ATTRIBUTE = re.compile(r'([^\s=]+)(?:\s*=\s*("[^"]*"|\'[^\']*\'|[^\s"\']+))?')
+REGEX_ATTRIBUTE_NAME = re.compile(r'^[A-Za-z_:][-A-Za-z0-9_:.]*$')
+REGEX_END_TAG = re.compile(r'^</([^\s>]+)>$')
+REGEX_TAG_NAME = re.compile(r'^</?([A-Za-z][^\s/>]*)')
+
+def split_attribute(attribute):
+	# returns (name, value) pair for attribute such as class="a b" or checked, anything that doesn't start
+	# with a name followed by = (such as template engine code, {{=item}}) is a name without a value, and gets
+	# written as is
+	name, equals, value = attribute.partition('=')
+	name, value = name.strip(), value.strip()
+	if not equals or not REGEX_ATTRIBUTE_NAME.match(name):
+		return attribute, None
+	if len(value) > 1 and value[0] == value[-1] and value[0] in ('"', "'") and value[0] not in value[1:-1]:
+		value = value[1:-1]
+	return name, value
+
+def quote_attribute(value):
+	# returns attribute value in quotes, double ones unless the value contains them
+	if '"' not in value:
+		return '"%s"' % value
+	if "'" not in value:
+		return "'%s'" % value
+	return '"%s"' % value.replace('"', '&quot;')
+
+def render_start_tag(element, attributes):
+	# returns start tag of element with given (name, value) pairs as attributes, values always get quoted
+	return '<%s>' % ' '.join([element] + [value is None and name or '%s=%s' % (name, quote_attribute(value))
+											for name, value in attributes])
+
+def split_start_tag(tag):
+	# returns (element, attributes) of a start tag written as text (such as the tags verbatim blocks get
+	# wrapped in), or None if it's something other than a single start tag
+	match = REGEX_START_TAG.match(tag.strip())
+	if match is None:
+		return None
+	return match.group(1), [split_attribute(attribute.group(0)) for attribute in REGEX_ATTRIBUTE.finditer(match.group(2))]
+
+def tag_kind(tag):
+	# returns kind of output (OUTPUT_BLOCK or OUTPUT_INLINE) a tag written out is, elements not known to be
+	# block-level count as inline, so that line breaks next to them are kept
+	match = REGEX_TAG_NAME.match(tag)
+	if match is None or match.group(1).lower() in BLOCK_ELEMENTS:
+		return OUTPUT_BLOCK
+	return OUTPUT_INLINE
+
+def verbatim_element(starttag, endtag):
+	# returns (element, attributes) of the element the tags around a verbatim block form, None if they
+	# don't form one
+	start = split_start_tag(starttag or '')
+	end = REGEX_END_TAG.match((endtag or '').strip())
+	if start is not None and end is not None and end.group(1) == start[0]:
+		return start
+	return None
+
+class TextWriter:
+	"""
+	Writes events out as the text of the page, indented or minified
+	"""
+
+	def __init__(self, output, minify=False):
+		self.output = output		# util.OutputBuffer
+		self.minify = minify		# leave out indentation and line breaks the markup doesn't need
+		self.last_output = None		# kind of what minified output ends with, None at the start of a line
+		self.preserving = None		# elements open inside of the whitespace-sensitive element being written as is
+
+	def state(self):
+		return (self.last_output, self.preserving)
+
+	def restore(self, state):
+		self.last_output, self.preserving = state
+
+	def write(self, kind, data):
+		minified = self.minify and self.preserving is None
+		if kind == START:
+			element, attributes, indent = data
+			if self.preserving is not None:
+				self.preserving += 1
+			self.write_line(indent, render_start_tag(element, attributes), minified)
+			if minified and element.lower() in PRESERVE_WHITESPACE:
+				# content of whitespace-sensitive elements gets written as is, including the line break
+				# after the start tag
+				self.preserving = 0
+				self.output.write('\n')
+		elif kind == END:
+			element, indent, tag, self_closing = data
+			if self_closing:
+				# start tag is the last thing written, its > (and line break) becomes />
+				if minified:
+					self.output.write(' />', -1)
+				else:
+					self.output.write(' />\n', -MAX_OVERLAP)
+			elif tag:
+				self.write_line(indent, tag, minified)
+			if self.preserving == 0:
+				# whitespace before the end tag still belongs to the content, the line break after it doesn't
+				self.preserving = None
+				if self.output.tail(1) == '\n':
+					self.output.truncate(1)
+				self.last_output = tag_kind('<%s>' % element)
+			elif self.preserving is not None:
+				self.preserving -= 1
+		elif kind == TEXT:
+			indent, text = data
+			self.write_line(indent, text, minified)
+		else:
+			indent, starttag, text, endtag = data
+			if minified:
+				self.write_verbatim(starttag, text, endtag)
+			elif starttag is None:
+				self.output.write(text)
+			else:
+				self.output.write('%s%s\n%s%s%s\n' % (indent, starttag, text, indent, endtag))
+
+	def write_line(self, indent, text, minified):
+		if minified:
+			self.write_minified(text)
+		else:
+			self.output.write(indent + text + '\n')
+
+	def write_minified(self, text):
+		# writes text without indentation and line break, line breaks only get kept next to text and between
+		# tags of inline elements, where they stand for a space
+		text = text.strip()
+		if not text:
+			return
+		kind = text[0] == '<' and text[-1] == '>' and tag_kind(text) or OUTPUT_TEXT
+		pair = (self.last_output, kind)
+		if self.last_output is not None and (OUTPUT_TEXT in pair or OUTPUT_BLOCK not in pair):
+			text = '\n' + text
+		self.output.write(text)
+		self.last_output = kind
+
+	def write_verbatim(self, starttag, text, endtag):
+		# minified counterpart of writing a verbatim block, only the tags around the text get minified
+		self.write_minified(starttag or '')
+		if text:
+			if self.last_output is not None:
+				text = '\n' + text
+			self.output.write(text)
+			self.last_output = text[-1] != '\n' and OUTPUT_TEXT or None
+		self.write_minified(endtag or '')
+
+def build_tree(events, root=None):
+	# returns xml.etree.ElementTree element for the document the events describe, lines of text within an
+	# element are joined with line breaks, attributes without a value get their name as the value (as in
+	# XHTML), declarations such as !DOCTYPE are left out
+	# a document with more than one top-level element (a fragment) gets wrapped in an element named root
+	from xml.etree import ElementTree # only needed by callers that want a tree
+	builder = ElementTree.TreeBuilder()
+	if root is not None:
+		builder.start(root, {})
+	depth = 0
+	skipped = 0		# depth of the declaration being left out, if any
+	top_level = 0
+	last = None
+	for kind, data in events:
+		if skipped:
+			if kind == START:
+				skipped += 1
+			elif kind == END:
+				skipped -= 1
+			continue
+		element = None
+		if kind == START:
+			element, attributes = data[:2]
+			if element[:1] in ('!', '?'):
+				skipped = 1
+				continue
+		elif kind == VERBATIM:
+			indent, starttag, text, endtag = data
+			wrapper = verbatim_element(starttag, endtag)
+			if wrapper is None:
+				builder.data(starttag is None and text or '%s\n%s%s\n' % (starttag, text, endtag))
+			else:
+				element, attributes = wrapper
+		if element is not None:
+			if not depth:
+				top_level += 1
+				if top_level > 1 and root is None:
+					raise ParserError("Document has more than one top-level element, pass root to wrap them")
+			builder.start(element, dict((name, value is None and name or value) for name, value in attributes))
+			depth += 1
+			if kind == VERBATIM:
+				builder.data(text)
+				builder.end(element)
+				depth -= 1
+		elif kind == END:
+			builder.end(data[0])
+			depth -= 1
+		elif kind == TEXT:
+			if last == TEXT:
+				builder.data('\n')
+			builder.data(data[1])
+		last = kind
+	if root is not None:
+		builder.end(root)
+	if top_level == 0 and root is None:
+		raise ParserError("Document has no elements to build a tree from")
+	return builder.close()
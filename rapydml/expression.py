@@ -0,0 +1,147 @@
+import ast, math, re, threading
+from collections import OrderedDict
+from util import ParserError
+
+
+# names expressions can refer to, there are no other builtins available to them
+SAFE_NAMES = {
+	'True'		: True,
+	'False'		: False,
+	'None'		: None,
+	'math'		: math,
+	'abs'		: abs,
+	'bool'		: bool,
+	'chr'		: chr,
+	'float'		: float,
+	'hex'		: hex,
+	'int'		: int,
+	'len'		: len,
+	'max'		: max,
+	'min'		: min,
+	'oct'		: oct,
+	'ord'		: ord,
+	'range'		: range,
+	'repr'		: repr,
+	'round'		: round,
+	'sorted'	: sorted,
+	'str'		: str,
+	'sum'		: sum,
+}
+
+# syntax allowed in expressions: literals, operators, comparisons, indexing and calls, but no lambdas,
+# comprehensions or anything else that could be used to dig into the interpreter
+SAFE_NODES = set([
+	ast.Expression, ast.Num, ast.Str, ast.List, ast.Tuple, ast.Dict, ast.Name, ast.Load,
+	ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp, ast.Call, ast.keyword, ast.Attribute,
+	ast.Subscript, ast.Index, ast.Slice,
+	ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+	ast.LShift, ast.RShift, ast.BitOr, ast.BitXor, ast.BitAnd,
+	ast.UAdd, ast.USub, ast.Not, ast.Invert, ast.And, ast.Or,
+	ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn,
+])
+
+# attributes expressions can't use even though they don't start with _, str.format can reach attributes of
+# its arguments through fields such as {0.__class__}
+UNSAFE_ATTRIBUTES = frozenset(['format'])
+
+MAX_CACHED_EXPRESSIONS = 1024
+MAX_RESULT_BITS = 65536		# largest integer ** and << can produce, bigger ones take ages to compute
+
+# plain arithmetic on numbers can't refer to anything, so there is no need to inspect its syntax tree, as long
+# as it doesn't raise to a power
+REGEX_NUMERIC = re.compile(r'^[0-9\s.+\-*/%()]*$')
+
+# compiled code of recently used expressions, keyed by their source, least recently used ones come first
+compiled_expressions = OrderedDict()
+cache_lock = threading.Lock() # OrderedDict isn't safe to reorder from several threads at once
+
+def has_math(text):
+	# returns true if text contains an arithmetic operator outside of double quotes, and one outside of single
+	# quotes, quotes get paired up starting from the end of the text
+	if '+' not in text and '-' not in text and '*' not in text and '/' not in text:
+		return False
+	double_quotes = text.count('"')
+	single_quotes = text.count("'")
+	outside_double = outside_single = False
+	for char in text:
+		if char == '"':
+			double_quotes -= 1
+		elif char == "'":
+			single_quotes -= 1
+		elif char in '+-*/':
+			# even number of quotes left to the right means we're not inside of a quoted string
+			outside_double = outside_double or not double_quotes % 2
+			outside_single = outside_single or not single_quotes % 2
+			if outside_double and outside_single:
+				return True
+	return False
+
+def check(tree, source):
+	# makes sure the expression only uses allowed syntax and names
+	for node in ast.walk(tree):
+		if type(node) not in SAFE_NODES:
+			raise ParserError("'%s' is not allowed in expression '%s'" % (type(node).__name__, source))
+		if isinstance(node, ast.Name) and node.id not in SAFE_NAMES:
+			raise ParserError("Name '%s' is not allowed in expression '%s'" % (node.id, source))
+		if isinstance(node, ast.Attribute) and (node.attr.startswith('_') or node.attr in UNSAFE_ATTRIBUTES):
+			raise ParserError("Attribute '%s' is not allowed in expression '%s'" % (node.attr, source))
+
+def check_size(bits):
+	# makes sure an integer operation doesn't produce a result of more than MAX_RESULT_BITS
+	if bits > MAX_RESULT_BITS:
+		raise ParserError("Result of expression would be too large")
+
+def power(base, exponent):
+	if isinstance(base, (int, long)) and isinstance(exponent, (int, long)) and abs(base) > 1:
+		check_size(exponent * abs(base).bit_length())
+	return base ** exponent
+
+def left_shift(value, count):
+	if isinstance(value, (int, long)) and isinstance(count, (int, long)) and value:
+		check_size(count + abs(value).bit_length())
+	return value << count
+
+# operators that can produce huge numbers out of small ones get replaced by calls to these, under names
+# expressions can't refer to themselves
+BOUNDED_OPERATORS = {
+	ast.Pow		: ('__power', power),
+	ast.LShift	: ('__left_shift', left_shift),
+}
+EVAL_NAMES = dict(SAFE_NAMES)
+EVAL_NAMES.update(BOUNDED_OPERATORS.values())
+
+class BoundOperators(ast.NodeTransformer):
+	"""
+	Replaces operators listed in BOUNDED_OPERATORS with calls to their bounded versions
+	"""
+
+	def visit_BinOp(self, node):
+		self.generic_visit(node)
+		if type(node.op) not in BOUNDED_OPERATORS:
+			return node
+		name = BOUNDED_OPERATORS[type(node.op)][0]
+		return ast.copy_location(ast.Call(ast.Name(name, ast.Load()), [node.left, node.right], [], None, None), node)
+
+def compile_expression(source):
+	# returns code object for the expression, reusing previously compiled code when possible
+	with cache_lock:
+		code = compiled_expressions.pop(source, None)
+		if code is not None:
+			compiled_expressions[source] = code
+			return code
+	if REGEX_NUMERIC.match(source) and '**' not in source:
+		code = compile(source.strip(), '<expression>', 'eval')
+	else:
+		tree = ast.parse(source.strip(), '<expression>', 'eval')
+		check(tree, source)
+		tree = ast.fix_missing_locations(BoundOperators().visit(tree))
+		code = compile(tree, '<expression>', 'eval')
+	with cache_lock:
+		if len(compiled_expressions) >= MAX_CACHED_EXPRESSIONS:
+			compiled_expressions.popitem(False)
+		compiled_expressions[source] = code
+	return code
+
+def evaluate(source):
+	# evaluates a Python expression, only names in SAFE_NAMES are available to it
+	return eval(compile_expression(source), {'__builtins__': {}}, EVAL_NAMES)
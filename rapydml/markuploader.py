@@ -1,4 +1,5 @@
 import os
+import cPickle as pickle
 from util import IndentParser
 
 
@@ -7,24 +8,32 @@ NORMAL	= 0
 SEPARATE= 1
 SINGLE	= 2
 
+# bump this whenever the format of compiled schemas changes
+SCHEMA_VERSION = 1
+
 def flatten_list(l):
 	# takes a list of lists and returns a single list
 	return [item for sublist in l for item in sublist]
 
-def uniq(l):
-	# remove duplicates from a list
-	seen = set()
-	seen_add = seen.add
-	return [item for item in l if item not in seen and not seen_add(item)]
-
 class LineParser:
 	def __init__(self):
+		# each entry holds the full set of attributes allowed at that level, children reuse the set of their
+		# parent unless they add attributes of their own
 		self.attr_stack = []
 		self.tree = IndentParser()
 	
+	def push_attributes(self, attrs):
+		if self.attr_stack:
+			inherited = self.attr_stack[-1]
+			if attrs and not attrs <= inherited:
+				inherited = inherited | attrs
+			self.attr_stack.append(inherited)
+		else:
+			self.attr_stack.append(attrs)
+	
 	def parse_line(self, line):
-		# takes a line in '' format and returns key, value pair, where the value is a tuple of flags and an
-		# array of allowed attributes
+		# takes a line in '' format and returns key, value pair, where the value is a tuple of flags and a
+		# frozenset of allowed attributes
 		
 		# separate tag and attributes into a list (flattening out any intermediate lists)
 		# this will create the following list:
@@ -45,30 +54,19 @@ class LineParser:
 			element = element[1:-1]
 		
 		# push and pop from the stack as needed
-		self.tree.handle_indent(line, [self.attr_stack.pop], [self.attr_stack.append, key_val])
+		self.tree.handle_indent(line, [self.attr_stack.pop], [self.push_attributes, frozenset(key_val)])
 		
 		if element == '.':	# meta-node, innacessible to the pyml file
 			return None, None
 		else:
-			attrs = uniq(flatten_list(self.attr_stack))
+			attrs = self.attr_stack[-1]
 			if '*' in attrs:
 				attrs = None
 			return element, (flag, attrs)
 		
 
-def load(markup, location=None):
-	# take markup and open the relevant file, reading data from it
-	# returns a hash of tags and their allowed attributes
-	# each entry follows this format:
-	#	key	->	([flags], [attrlist])
-	#		attrlist is an empty list if no attributes are supported, attrlist is None if any attributes are supported
-	
-	# convert markup to filename
-	if location is None:
-		location = os.getcwd()
-	filename = os.path.join(location, 'markup', markup)
-	
-	# start scanning the rules
+def parse(filename):
+	# reads the rules from given markup file, returns a hash of tags and their allowed attributes
 	buffer = ''
 	html_tags = {}
 	parser = LineParser()
@@ -91,9 +89,82 @@ def load(markup, location=None):
 				key, val = parser.parse_line(buffer + line)
 				if key is not None:
 					try:
-						html_tags[key][1].extend(val[1])
+						# repeated tag, first occurence decides the flag
+						flag, attrs = html_tags[key]
+						if attrs is not None and val[1] is not None:
+							attrs = attrs | val[1]
+						else:
+							attrs = None
+						html_tags[key] = (flag, attrs)
 					except KeyError:
 						html_tags[key] = val
 				buffer = ''
 	return html_tags
-			
+
+def schema_filename(filename):
+	# compiled schema lives next to the grammar, hidden so it doesn't show up as a markup of its own
+	directory, name = os.path.split(filename)
+	return os.path.join(directory, '.%s.schema' % name)
+
+def read_schema(filename, stamp):
+	# returns tags stored in compiled schema, or None if it doesn't exist or is stale
+	try:
+		with open(schema_filename(filename), 'rb') as schema:
+			stored_stamp, html_tags = pickle.load(schema)
+	except Exception:
+		return None
+	if stored_stamp != stamp:
+		return None
+	return html_tags
+
+def write_schema(filename, stamp, html_tags):
+	# pickle keeps attribute sets shared between tags shared in the schema as well
+	import tempfile # only needed when the grammar changed, which doesn't happen on most runs
+	path = schema_filename(filename)
+	try:
+		fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+	except (IOError, OSError):
+		return # markup directory is read-only, we'll just parse the grammar every time
+	try:
+		try:
+			with os.fdopen(fd, 'wb') as schema:
+				pickle.dump((stamp, html_tags), schema, pickle.HIGHEST_PROTOCOL)
+			os.chmod(tmp_path, 0644)
+			os.rename(tmp_path, path)
+		except:
+			os.remove(tmp_path) # don't leave a partial schema next to the grammar
+			raise
+	except (IOError, OSError):
+		pass # couldn't write the schema (i.e. disk is full), the grammar gets parsed next time as well
+
+# schemas loaded by this process, keyed by grammar filename
+schemas = {}
+
+def load(markup, location=None):
+	# take markup and open the relevant file, reading data from it
+	# returns a hash of tags and their allowed attributes
+	# each entry follows this format:
+	#	key	->	(flag, attrset)
+	#		attrset is an empty frozenset if no attributes are supported, None if any attributes are supported
+	# the grammar gets compiled into a schema file the first time it's used, and is recompiled when it changes
+	
+	# convert markup to filename
+	if location is None:
+		location = os.getcwd()
+	filename = os.path.join(location, 'markup', markup)
+	stat = os.stat(filename)
+	stamp = (SCHEMA_VERSION, stat.st_mtime, stat.st_size)
+	
+	try:
+		stored_stamp, html_tags = schemas[filename]
+		if stored_stamp == stamp:
+			return html_tags
+	except KeyError:
+		pass
+	
+	html_tags = read_schema(filename, stamp)
+	if html_tags is None:
+		html_tags = parse(filename)
+		write_schema(filename, stamp, html_tags)
+	schemas[filename] = (stamp, html_tags)
+	return html_tags
@@ -0,0 +1,126 @@
+import time, linecache
+
+
+# parser methods timed as each phase, 'tags' being the parsing of each line that no other phase covers, time
+# spent outside of all of them (setting the parser up, closing the page) counts as 'other'
+# running method and loop bodies is timed by Parser.call_method itself, since they share the logic
+PHASES = [
+	('tags',				['handle_line']),
+	('imports',				['import_module']),
+	('variables',			['set_variable', 'get_variables', 'expand_assignment_ops']),
+	('loops',				['create_loop', 'unroll_loop']),
+	('methods',				['create_method']),
+	('template engines',	['create_template_engine', 'parse_template_engine_definition',
+							 'parse_template_engine_call']),
+	('verbatim',			['handle_verbatim_declaration', 'handle_verbatim_call']),
+	('output',				['event', 'close_last_element']),
+]
+DEFAULT_PHASE = 'other'
+
+class Profiler:
+	"""
+	Records time spent compiling a page, both by phase of the compiler and by line of the source file. Work
+	done by lines generated through methods and loops gets charged to the line that defined them. Times are
+	exclusive, time spent in a nested phase or line doesn't count towards the one it was invoked from.
+	"""
+
+	def __init__(self, clock=time.time):
+		self.clock = clock
+		self.phase_times = {}
+		self.phase_calls = {}
+		self.line_times = {}	# (filename, line number) -> seconds
+		self.line_hits = {}
+		self.stack = [DEFAULT_PHASE]
+		self.line = None
+		self.parsers = []
+		self.started = self.mark = clock()
+
+	def charge(self):
+		# charges time since the last event to the current phase and line
+		now = self.clock()
+		elapsed = now - self.mark
+		self.mark = now
+		phase = self.stack[-1]
+		self.phase_times[phase] = self.phase_times.get(phase, 0.0) + elapsed
+		if self.line is not None:
+			self.line_times[self.line] = self.line_times.get(self.line, 0.0) + elapsed
+
+	def enter(self, phase):
+		self.charge()
+		self.stack.append(phase)
+		self.phase_calls[phase] = self.phase_calls.get(phase, 0) + 1
+
+	def exit(self):
+		self.charge()
+		self.stack.pop()
+
+	def set_line(self, line):
+		# makes line (a (filename, line number) pair) the current one, returns the previous one
+		self.charge()
+		previous, self.line = self.line, line
+		if line is not None:
+			self.line_hits[line] = self.line_hits.get(line, 0) + 1
+		return previous
+
+	def restore_line(self, line):
+		# switches back to the line that was current before set_line, without counting another hit
+		self.charge()
+		self.line = line
+
+	def call(self, phase, function, *args, **kwargs):
+		# invokes function, timing it as given phase
+		self.enter(phase)
+		try:
+			return function(*args, **kwargs)
+		finally:
+			self.exit()
+
+	def wrap(self, phase, function):
+		def timed(*args, **kwargs):
+			return self.call(phase, function, *args, **kwargs)
+		return timed
+
+	def attach(self, parser):
+		# times methods of the parser that belong to each phase, the parser reports source lines on its own
+		if parser in self.parsers:
+			return # parser resetting itself
+		self.parsers.append(parser)
+		for phase, names in PHASES:
+			for name in names:
+				setattr(parser, name, self.wrap(phase, getattr(parser, name)))
+
+	def results(self, limit=None):
+		# returns profile as a dictionary suitable for JSON, lines are sorted from hottest, up to limit of them
+		total = sum(self.phase_times.values())
+		phases = {}
+		for phase, seconds in self.phase_times.items():
+			phases[phase] = {'seconds': seconds, 'calls': self.phase_calls.get(phase, 0)}
+		lines = []
+		for (filename, line_num), seconds in sorted(self.line_times.items(), key=lambda item: -item[1])[:limit]:
+			lines.append({
+				'file'		: filename,
+				'line'		: line_num,
+				'seconds'	: seconds,
+				'hits'		: self.line_hits.get((filename, line_num), 0),
+				'source'	: linecache.getline(filename, line_num).strip(),
+			})
+		return {'total': total, 'phases': phases, 'lines': lines}
+
+	def report(self, limit=20):
+		# returns human-readable summary of the profile
+		results = self.results(limit)
+		total = results['total'] or 1e-9
+		output = ['%-18s %10s %7s %9s' % ('phase', 'seconds', '%', 'calls')]
+		for phase, stats in sorted(results['phases'].items(), key=lambda item: -item[1]['seconds']):
+			output.append('%-18s %10.4f %6.1f%% %9d' % (phase, stats['seconds'], stats['seconds'] / total * 100,
+														stats['calls']))
+		output.append('%-18s %10.4f' % ('total', results['total']))
+		output.append('')
+		output.append('%-30s %10s %7s %9s  %s' % ('hottest lines', 'seconds', '%', 'hits', 'source'))
+		for line in results['lines']:
+			location = '%s:%d' % (line['file'], line['line'])
+			if len(location) > 30:
+				location = '...' + location[-27:]
+			output.append('%-30s %10.4f %6.1f%% %9d  %s' % (location, line['seconds'],
+														line['seconds'] / total * 100, line['hits'], line['source']))
+		return '\n'.join(output)
@@ -0,0 +1,110 @@
+"""
+Reads .pyml files as logical lines (lines continued with a trailing backslash joined together) and caches
+the lines of imported modules, Parser.handle_line does the rest.
+"""
+
+import os
+from collections import OrderedDict
+from util import IndentParser
+
+
+class Line:
+	"""
+	Single logical line of a .pyml file (multi-lines already joined), everything beyond telling blank lines
+	and comments apart is left to Parser.handle_line
+	"""
+	__slots__ = ('line', 'tag', 'lineno', 'blank')
+
+	def __init__(self, line, lineno):
+		self.line = line			# original text, including indentation and line break
+		self.tag = line.strip()
+		self.lineno = lineno		# line number in source file (last line for multi-lines)
+		self.blank = not self.tag or self.tag[0] == '#'	# blank lines and comments only matter to verbatim blocks
+
+	def __repr__(self):
+		return '<%d %r>' % (self.lineno, self.tag)
+
+def join_lines(source):
+	# yields (line_number, line) pairs, gluing lines ending in '\' together with the line after them
+	# extra spaces after '\' at the line end get ignored
+	buffer = ''
+	line_num = 0
+	for line in source:
+		line_num += 1
+		if line.rstrip()[-1:] == '\\':
+			if buffer:
+				line = ' ' + line.lstrip()
+			buffer += line.rstrip()[:-1]
+			continue
+		elif buffer:
+			line = buffer + ' ' + line.lstrip()
+			buffer = ''
+		yield line_num, line
+
+def iter_lines(source):
+	# turns an iterable of text lines into Line objects, yielding each one as soon as it's read
+	for line_num, line in join_lines(source):
+		yield Line(line, line_num)
+
+def split(source, size):
+	# splits lines of a page into units of at most `size` logical lines in document order: a line goes into
+	# one unit along with the lines nested under it if they fit, otherwise it forms a unit of its own and
+	# the lines nested under it get split the same way
+	# returns (lines, text) pairs, lines being (line number, line, indent) of each logical line in the unit
+	indent_parser = IndentParser()
+	lines = []
+	ends = []	# index of the first line after the lines nested under each line
+	open_lines = []
+	for line_num, line in join_lines(source):
+		index = len(lines)
+		tag = line.strip()
+		if not tag or tag[0] == '#':
+			# blank lines and comments get nested under the last line, they can be part of a verbatim block
+			lines.append((line_num, line, open_lines and lines[open_lines[-1]][2] + 1 or 0))
+			ends.append(index + 1)
+			continue
+		indent = indent_parser.find_indent(line)
+		while open_lines and lines[open_lines[-1]][2] >= indent:
+			ends[open_lines.pop()] = index
+		lines.append((line_num, line, indent))
+		ends.append(None)
+		open_lines.append(index)
+	for index in open_lines:
+		ends[index] = len(lines)
+	units = []
+	index = 0
+	while index < len(lines):
+		end = ends[index] - index <= size and ends[index] or index + 1
+		units.append((lines[index:end], ''.join([line for line_num, line, indent in lines[index:end]])))
+		index = end
+	return units
+
+# lines of modules we already read, keyed by absolute path and validated by modification time, this allows
+# library modules that get imported by many pages to be read only once per process, pages themselves don't
+# get cached, and the least recently used modules get dropped once there are more than MAX_CACHED_MODULES
+MAX_CACHED_MODULES = 256
+module_cache = OrderedDict()
+
+def read(filename):
+	# returns list of lines of given file
+	with open(filename, 'r') as source:
+		return list(iter_lines(source))
+
+def load(filename):
+	# returns list of lines of given module, reusing the cached one if the file didn't change
+	path = os.path.abspath(filename)
+	with open(path, 'r') as source:
+		stat = os.fstat(source.fileno())
+		key = (stat.st_mtime, stat.st_size)
+		try:
+			cached_key, lines = module_cache.pop(path)
+			if cached_key == key:
+				module_cache[path] = (key, lines) # most recently used go last
+				return lines
+		except KeyError:
+			pass
+		lines = list(iter_lines(source))
+	module_cache[path] = (key, lines)
+	if len(module_cache) > MAX_CACHED_MODULES:
+		module_cache.popitem(last=False)
+	return lines
@@ -0,0 +1,93 @@
+"""
+Backend turning a compiled page into a Python module with a render(**context) function, for pages that fill
+in some values at request time. Such values get declared in the page as slots:
+
+	$user := slot()			# gets escaped for markup when rendered
+	$article := slot(raw)	# gets inserted as is
+
+The compiler outputs a marker wherever a slot gets used, this module splits the output on those markers,
+turning the static text between them into string constants of the module, so that rendering the page
+costs one join. Attribute values are always written in quotes, so that no slot value can end one.
+"""
+
+import re
+from util import ParserError
+
+
+MARKER = '\x1a'			# control character that can't appear in a page, delimits slot names in compiled output
+RAW = '!'				# follows the opening marker for slots inserted without escaping
+REGEX_SLOT_DECLARATION = re.compile(r'^slot\(\s*(raw)?\s*\)$')
+REGEX_SLOT = re.compile(r'%s(%s?)([A-Za-z_][A-Za-z0-9_]*)%s' % (MARKER, re.escape(RAW), MARKER))
+
+MODULE_HEADER = '''# Generated by RapydML from %s, edit the page and recompile it rather than changing this file
+
+VARIABLES = %r
+
+def escape(value):
+	# converts value to text with characters that have a meaning in markup replaced by entities
+	return ('%%s' %% (value,)).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') \\
+			.replace('"', '&quot;').replace("'", '&#39;')
+
+'''
+
+def slot_marker(name, raw=False):
+	# returns the text compiled output contains in place of the value of slot `name`
+	return MARKER + (raw and RAW or '') + name + MARKER
+
+def check_slots(element, attributes):
+	# makes sure a tag only uses slots in attribute values, which always get written in quotes (see
+	# events.render_start_tag) and escaped along with the quotes when the page renders, a slot anywhere else
+	# could add attributes of its own
+	if MARKER in element:
+		raise ParserError("Slots can't be used as element names: %s" % REGEX_SLOT.sub(r'$\2', element))
+	for name, value in attributes:
+		if MARKER in name:
+			raise ParserError("Slots can only be used in attribute values, not as attribute names: %s"
+								% REGEX_SLOT.sub(r'$\2', name))
+
+def build_module(output, source_name='<string>'):
+	# returns source of a Python module rendering compiled output, static runs become module constants and
+	# slots the values passed to render() under the same name (without the $), every slot gets escaped or
+	# converted once no matter how many times the page uses it
+	parts = REGEX_SLOT.split(output)
+	names = []
+	slots = []	# (local, name, raw) in order of first use
+	seen = set()
+	items = []
+	lines = []
+	for index in range(0, len(parts), 3):
+		if parts[index]:
+			lines.append('S%d = %r\n' % (index / 3, parts[index]))
+			items.append('S%d' % (index / 3))
+		if index + 2 < len(parts):
+			raw, name = parts[index + 1], parts[index + 2]
+			local = (raw and 'r_' or 'v_') + name
+			if local not in seen:
+				seen.add(local)
+				slots.append((local, name, raw))
+				if name not in names:
+					names.append(name)
+			items.append(local)
+	lines.insert(0, MODULE_HEADER % (source_name, tuple(names)))
+	lines.append('\ndef render(**context):\n')
+	for local, name, raw in slots:
+		# a missing value raises KeyError naming the slot
+		lines.append(raw and "\t%s = '%%s' %% (context[%r],)\n" % (local, name)
+				or '\t%s = escape(context[%r])\n' % (local, name))
+	if len(items) > 1:
+		lines.append("\treturn ''.join((%s))\n" % ', '.join(items))
+	else:
+		lines.append("\treturn %s\n" % (items and items[0] or "''"))
+	return ''.join(lines)
+
+def load(module_source, name='rapydml_page'):
+	# executes module source returned by build_module and returns the resulting module, for rendering pages
+	# without writing them to disk first
+	import imp
+	# the code runs in a namespace of its own rather than in the module's, Python clears the namespace of a
+	# module once it's gone, which would break render functions outliving their module
+	namespace = {'__name__': name}
+	exec compile(module_source, '<%s>' % name, 'exec') in namespace
+	module = imp.new_module(name)
+	module.__dict__.update(namespace)
+	return module
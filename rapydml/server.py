@@ -0,0 +1,282 @@
+import os, sys, time, json, signal, threading, traceback
+import SocketServer, Queue
+import multiprocessing
+from collections import deque
+
+from markuploader import load
+from compiler import Parser
+from cache import CompileCache
+from util import ParserError, CompileError
+from batch import write_output
+from compress import Compression
+from client import DEFAULT_SOCKET, CONNECT_TIMEOUT, request
+
+
+LATENCY_SAMPLES = 1000	# number of most recent requests latency percentiles are computed from
+
+class Daemon:
+	"""
+	State kept warm between compile requests: markuploader and reader keep grammars and parsed modules in memory
+	on their own, on top of that the daemon holds compiled preludes, caches and request statistics
+	with a pool, pages get compiled by its worker processes (each of them keeping a Daemon of its own warm),
+	the daemon itself only hands them out and keeps the statistics
+	"""
+
+	def __init__(self, location, workers, pool=None):
+		self.location = location
+		self.workers = workers
+		self.pool = pool
+		self.lock = threading.Lock()
+		self.preludes = {}	# (markup, modules, directory, minify, slots) -> (snapshot, modification times of its files)
+		self.caches = {}	# (directory, max size, variant) -> CompileCache
+		self.started = time.time()
+		self.requests = {}	# command -> number of requests
+		self.failures = 0
+		self.pages = 0
+		self.active = 0		# compile requests being worked on
+		self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+	def get_cache(self, settings):
+		if settings is None:
+			return None
+		key = (settings['directory'], settings['max_size'], settings['variant'])
+		with self.lock:
+			if key not in self.caches:
+				self.caches[key] = CompileCache(*key)
+			return self.caches[key]
+
+	def get_prelude(self, markup, modules, directory, minify=False, slots=False):
+		# returns snapshot of the prelude, recompiling it if any of its files changed since
+		if not modules:
+			return None
+		key = (markup, tuple(modules), directory, minify, slots)
+		with self.lock:
+			entry = self.preludes.get(key)
+		if entry is not None and entry[1] == stamp(entry[0].prelude_paths):
+			return entry[0]
+		snapshot = Parser(load(markup, self.location), minify=minify, slots=slots).compile_prelude(modules, directory)
+		with self.lock:
+			self.preludes[key] = (snapshot, stamp(snapshot.prelude_paths))
+		return snapshot
+
+	def compile(self, message):
+		# compiles every source in the request, spreading them across up to `jobs` worker processes (all of
+		# them by default), returns results in the format of batch.compile_source
+		sources = message['sources']
+		jobs = max(1, min(message.get('jobs') or self.workers, self.workers, len(sources)))
+		if self.pool is None:
+			return self.compile_sources(message)
+		requests = [dict(message, sources=sources[i::jobs]) for i in range(jobs)]
+		results = []
+		for chunk in self.pool.map(compile_in_worker, requests):
+			results.extend(chunk)
+		return results
+
+	def compile_sources(self, message):
+		# compiles every source in the request in this process, writing output next to it
+		markup = message.get('markup', 'html')
+		markup_file = os.path.join(self.location, 'markup', markup)
+		minify = message.get('minify', False)
+		python = message.get('python', False)
+		try:
+			snapshot = self.get_prelude(markup, message.get('prelude', []), message.get('prelude_dir'), minify,
+										python)
+		except CompileError as error:
+			return [(source, 0, 0.0, 'Failed compiling prelude: %s\n%r' % (error, error.line))
+					for source in message['sources']]
+		except ParserError as error:
+			return [(source, 0, 0.0, 'Failed compiling prelude: %s' % error) for source in message['sources']]
+		except Exception:
+			return [(source, 0, 0.0, 'Failed compiling prelude\n%s' % traceback.format_exc())
+					for source in message['sources']]
+		cache = self.get_cache(message.get('cache'))
+		compression = message.get('compression') and Compression(**message['compression'])
+		parser = Parser(load(markup, self.location), cache is not None and cache.commands or None, minify=minify,
+						slots=python)
+		results = []
+		for source in message['sources']:
+			start = time.time()
+			try:
+				compiled = None
+				if cache is not None:
+					compiled = cache.lookup(source, markup_file)
+				if compiled is None:
+					compiled = parser.parse(source, snapshot=snapshot)
+					if cache is not None:
+						cache.save(source, markup_file, compiled, parser.imported_paths)
+				size = write_output(source, compiled, message.get('acknowledge', True), compression, python)
+				results.append((source, size, time.time() - start, None))
+			except CompileError as error:
+				results.append((source, 0, time.time() - start, '%s\n%r' % (error, error.line)))
+			except ParserError as error:
+				results.append((source, 0, time.time() - start, str(error)))
+			except Exception:
+				results.append((source, 0, time.time() - start, traceback.format_exc()))
+		return results
+
+	def handle(self, message):
+		# returns reply to the request
+		command = message.get('command')
+		if command == 'compile':
+			with self.lock:
+				self.active += 1
+			try:
+				results = self.compile(message)
+			finally:
+				with self.lock:
+					self.active -= 1
+			with self.lock:
+				self.pages += len(results)
+				self.failures += len([result for result in results if result[3] is not None])
+			return {'results': results}
+		elif command == 'stats':
+			return self.stats()
+		elif command == 'ping':
+			return {'pid': os.getpid()}
+		raise ParserError("Unknown command '%s'" % command)
+
+	def record(self, command, seconds):
+		with self.lock:
+			self.requests[command] = self.requests.get(command, 0) + 1
+			if command == 'compile':
+				self.latencies.append(seconds)
+
+	def stats(self):
+		# returns request counts and latency percentiles (in milliseconds) of recent compile requests
+		with self.lock:
+			latencies = sorted(self.latencies)
+			stats = {
+				'pid'		: os.getpid(),
+				'uptime'	: time.time() - self.started,
+				'workers'	: self.workers,
+				'active'	: self.active,
+				'requests'	: dict(self.requests),
+				'pages'		: self.pages,
+				'failures'	: self.failures,
+			}
+		if latencies:
+			stats['latency_ms'] = {
+				'mean'	: sum(latencies) / len(latencies) * 1000,
+				'p50'	: percentile(latencies, 50) * 1000,
+				'p90'	: percentile(latencies, 90) * 1000,
+				'p99'	: percentile(latencies, 99) * 1000,
+				'max'	: latencies[-1] * 1000,
+			}
+		return stats
+
+# Daemon of a worker process, set up once by init_worker
+worker = {}
+
+def init_worker(location):
+	# Ctrl+C is for the daemon to handle, workers just get terminated along with it
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	worker['daemon'] = Daemon(location, 1)
+
+def compile_in_worker(message):
+	return worker['daemon'].compile_sources(message)
+
+def stamp(paths):
+	# modification times of given files, None for missing ones
+	stamps = []
+	for path in paths:
+		try:
+			stamps.append(os.stat(path).st_mtime)
+		except OSError:
+			stamps.append(None)
+	return stamps
+
+def percentile(values, percent):
+	# nearest-rank percentile of sorted values
+	return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+	"""
+	Reads one JSON request per line and answers each with a line of JSON, errors are reported as
+	{"error": message} rather than closing the connection
+	"""
+
+	def handle(self):
+		daemon = self.server.daemon
+		for line in iter(self.rfile.readline, ''):
+			start = time.time()
+			try:
+				try:
+					message = json.loads(line)
+				except ValueError:
+					raise ParserError("Request isn't valid JSON: %s" % line.strip())
+				command = message.get('command')
+				if command == 'shutdown':
+					reply = {'pid': os.getpid()}
+					threading.Thread(target=self.server.shutdown).start()
+				else:
+					reply = daemon.handle(message)
+			except ParserError as error:
+				command, reply = 'invalid', {'error': str(error)}
+			except Exception:
+				command, reply = 'invalid', {'error': traceback.format_exc()}
+			daemon.record(command, time.time() - start)
+			self.wfile.write(json.dumps(reply) + '\n')
+			self.wfile.flush()
+
+class Server(SocketServer.UnixStreamServer):
+	"""
+	Unix socket server handing connections to a fixed pool of threads, which pass the pages on to worker
+	processes and wait for them to be compiled
+	"""
+
+	def __init__(self, path, daemon):
+		self.daemon = daemon
+		self.connections = Queue.Queue()
+		# the daemon writes files on behalf of whoever connects to it, so only its owner may connect, the
+		# socket gets created with the right permissions rather than fixed up after bind
+		umask = os.umask(0177)
+		try:
+			SocketServer.UnixStreamServer.__init__(self, path, RequestHandler)
+		finally:
+			os.umask(umask)
+		for i in range(daemon.workers):
+			worker = threading.Thread(target=self.work)
+			worker.daemon = True
+			worker.start()
+
+	def process_request(self, request, client_address):
+		self.connections.put((request, client_address))
+
+	def work(self):
+		while True:
+			request, client_address = self.connections.get()
+			try:
+				self.finish_request(request, client_address)
+			except Exception:
+				self.handle_error(request, client_address)
+			finally:
+				self.shutdown_request(request)
+
+def serve(location, path=None, workers=4):
+	# runs the daemon until it's told to shut down or interrupted
+	path = path or DEFAULT_SOCKET
+	if os.path.exists(path):
+		if request({'command': 'ping'}, path, CONNECT_TIMEOUT) is not None:
+			raise ParserError("Another RapydML daemon is already listening on %s" % path)
+		os.remove(path) # left behind by a daemon that didn't exit cleanly
+	# workers get forked before there is a socket or any threads, so they inherit neither
+	pool = multiprocessing.Pool(workers, init_worker, (location,))
+	try:
+		server = Server(path, Daemon(location, workers, pool))
+	except:
+		pool.terminate()
+		raise
+	print 'RapydML daemon listening on %s with %d workers' % (path, workers)
+	sys.stdout.flush()
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		pool.terminate()
+		pool.join()
+		try:
+			os.remove(path)
+		except OSError:
+			pass
@@ -15,6 +15,23 @@ class ShellError(ParserError):
 	"""
 	pass
 
+class CompileError(ParserError):
+	"""
+	Error raised by Parser.parse, records where in which file the compilation failed
+	"""
+	
+	def __init__(self, message, filename, line_num, line):
+		self.message = message
+		self.filename = filename
+		self.line_num = line_num
+		self.line = line
+	
+	def __str__(self):
+		if self.line_num is None:
+			# error at the end of the file, such as an unterminated block
+			return "Error in %s: %s" % (self.filename, self.message)
+		return "Error in %s: line %d: %s" % (self.filename, self.line_num, self.message)
+
 class IndentParser:
 	def __init__(self):
 		self.indent = 0
@@ -54,3 +71,104 @@ class IndentParser:
 			return ''
 		else:
 			return self.indent_marker * num
+
+class OutputBuffer:
+	"""
+	Helper class for accumulating compiled output as a list of chunks rather than a single string,
+	so that appending and rewriting the tail don't copy the whole document
+	"""
+	
+	def __init__(self):
+		self.chunks = []
+		self.length = 0
+		self.sink = None
+	
+	def __len__(self):
+		return self.length
+	
+	def pass_on(self, sink, chunk_size, keep=0):
+		# from now on, whenever more than chunk_size characters collect in the buffer they get drained into
+		# sink (a callable), except for the last `keep` characters
+		self.sink = sink
+		self.chunk_size = chunk_size
+		self.keep = keep
+	
+	def write(self, text, overlap=0):
+		# appends text to the buffer, a negative overlap drops that many trailing characters first
+		if overlap:
+			self.truncate(-overlap)
+		if text:
+			self.chunks.append(text)
+			self.length += len(text)
+			if self.sink is not None and self.length >= self.chunk_size + self.keep:
+				self.sink(self.drain(self.keep))
+	
+	def truncate(self, count):
+		# removes last `count` characters, only the chunks containing them get touched
+		while count > 0 and self.chunks:
+			last = self.chunks.pop()
+			if len(last) > count:
+				self.chunks.append(last[:-count])
+				self.length -= count
+				return
+			self.length -= len(last)
+			count -= len(last)
+	
+	def tail(self, count):
+		# returns the last `count` characters, joining only the chunks that contain them
+		parts = []
+		for chunk in reversed(self.chunks):
+			if count <= 0:
+				break
+			parts.append(chunk[-count:])
+			count -= len(chunk)
+		parts.reverse()
+		return ''.join(parts)
+	
+	def drain(self, keep=0):
+		# removes and returns everything but the last `keep` characters, so that output can be passed on
+		# as it's produced while the tail still can be rewritten
+		text = self.getvalue()
+		cut = max(0, len(text) - keep)
+		self.chunks = text[cut:] and [text[cut:]] or []
+		self.length = len(text) - cut
+		return text[:cut]
+	
+	def getvalue(self):
+		# collapse the chunks into one, so repeated calls don't redo the join
+		if len(self.chunks) > 1:
+			self.chunks = [''.join(self.chunks)]
+		if self.chunks:
+			return self.chunks[0]
+		return ''
+
+class Scope:
+	"""
+	Helper class for the variable space of a method call, variables assigned within the call shadow
+	the parent space without modifying it, so the parent never needs to be copied
+	"""
+	
+	def __init__(self, parent):
+		self.parent = parent
+		self.local_vars = {}
+	
+	def __getitem__(self, key):
+		try:
+			return self.local_vars[key]
+		except KeyError:
+			return self.parent[key]
+	
+	def __setitem__(self, key, value):
+		self.local_vars[key] = value
+	
+	def __contains__(self, key):
+		return key in self.local_vars or key in self.parent
+	
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+	
+	def keys(self):
+		return list(set(self.parent.keys()) | set(self.local_vars))
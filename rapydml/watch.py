@@ -0,0 +1,160 @@
+import os, sys, time, traceback
+
+from markuploader import load
+from compiler import Parser
+from util import ParserError, CompileError
+from batch import find_sources, write_output
+
+
+DEFAULT_INTERVAL = 1.0	# seconds between polls
+
+class DependencyGraph:
+	"""
+	Helper class for tracking which files import which, built from the imports the compiler resolved
+	"""
+
+	def __init__(self):
+		self.imports = {}	# path -> set of paths it imports directly
+
+	def update(self, import_graph):
+		# takes Parser.import_graph of a finished compile, replacing what we knew about files in it
+		for path, imported in import_graph.items():
+			self.imports[path] = set(imported)
+
+	def remove(self, path):
+		self.imports.pop(path, None)
+
+	def files(self):
+		# returns all files that are part of the graph, either as importers or imported modules
+		files = set(self.imports)
+		for imported in self.imports.values():
+			files.update(imported)
+		return files
+
+	def dependents(self, paths):
+		# returns given paths along with every file importing any of them, directly or through other imports
+		importers = {}
+		for path, imported in self.imports.items():
+			for module in imported:
+				importers.setdefault(module, set()).add(path)
+		result = set(paths)
+		stack = list(paths)
+		while stack:
+			for importer in importers.get(stack.pop(), ()):
+				if importer not in result:
+					result.add(importer)
+					stack.append(importer)
+		return result
+
+class Watcher:
+	"""
+	Polls the pages in given inputs (and all files they import) for changes, recompiling only the pages
+	affected by each change, and only the parts of those pages that changed
+	"""
+
+	def __init__(self, inputs, markup, location, acknowledge=True, interval=DEFAULT_INTERVAL, log=sys.stdout,
+				prelude=(), minify=False, compression=None, python=False):
+		# pages and the files they import are tracked by absolute path, so inputs have to match them
+		self.inputs = [item.startswith('@') and '@' + os.path.abspath(item[1:]) or os.path.abspath(item) for item in inputs]
+		self.prelude = tuple(prelude)
+		self.prelude_dir = os.getcwd()
+		self.prelude_paths = set()
+		self.prelude_stale = bool(self.prelude)
+		self.snapshot = None
+		self.parser = Parser(load(markup, location), minify=minify, slots=python)
+		self.acknowledge = acknowledge
+		self.compression = compression
+		self.python = python
+		self.interval = interval
+		self.log = log
+		self.graph = DependencyGraph()
+		self.pages = set()
+		self.mtimes = {}
+		self.blocks = {}	# page -> blocks of its last compile, for Parser.parse_incremental
+
+	def report(self, message):
+		self.log.write('[%s] %s\n' % (time.strftime('%H:%M:%S'), message))
+		self.log.flush()
+
+	def scan(self):
+		# returns modification times of all pages and the files they depend on
+		self.pages = set(find_sources(self.inputs))
+		mtimes = {}
+		for path in self.pages | self.graph.files() | self.prelude_paths:
+			try:
+				mtimes[path] = os.stat(path).st_mtime
+			except OSError:
+				pass # file was removed
+		return mtimes
+
+	def load_prelude(self):
+		# compiles prelude modules all pages start from, returns False if that failed
+		self.snapshot = None
+		try:
+			self.snapshot = self.parser.compile_prelude(self.prelude, self.prelude_dir)
+			self.report('Compiled prelude %s' % ', '.join(self.prelude))
+		except CompileError as error:
+			self.report('%s\n%r' % (error, error.line))
+		except ParserError as error:
+			self.report('Failed compiling prelude: %s' % error)
+		except Exception:
+			self.report('Failed compiling prelude\n%s' % traceback.format_exc())
+		# even a failed compile tells us which files to keep an eye on
+		self.prelude_paths = set(self.parser.imported_paths)
+		self.prelude_stale = False
+		return self.snapshot is not None
+	
+	def compile(self, page):
+		try:
+			compiled = self.parser.parse_incremental(page, self.blocks.get(page, ()), self.snapshot)
+			self.blocks[page] = self.parser.blocks
+			size = write_output(page, compiled, self.acknowledge, self.compression, self.python)
+			if self.parser.reused_blocks:
+				self.report('Compiled %s (%d bytes, reused %d of %d blocks)' %
+							(page, size, self.parser.reused_blocks, len(self.parser.blocks)))
+			else:
+				self.report('Compiled %s (%d bytes)' % (page, size))
+		except CompileError as error:
+			self.report('%s\n%r' % (error, error.line))
+		except Exception:
+			self.report('Failed compiling %s\n%s' % (page, traceback.format_exc()))
+		# even a failed compile tells us which files this page got to import
+		self.graph.update(self.parser.import_graph)
+
+	def poll(self):
+		# checks for changes once, recompiling affected pages, returns the pages that were compiled
+		mtimes = self.scan()
+		changed = set(path for path, mtime in mtimes.items() if self.mtimes.get(path) != mtime)
+		for path in set(self.mtimes) - set(mtimes):
+			# deleted files affect pages that imported them
+			changed.add(path)
+			self.graph.remove(path)
+			self.blocks.pop(path, None)
+		self.mtimes = mtimes
+		if changed & self.prelude_paths:
+			self.prelude_stale = True
+		if self.prelude_stale:
+			if not self.load_prelude():
+				return [] # no point compiling pages until the prelude is fixed
+			# all pages depend on the prelude
+			changed.update(self.pages)
+		affected = sorted(self.graph.dependents(changed) & self.pages)
+		for page in affected:
+			self.compile(page)
+		
+		# start tracking files we just found out about, without treating them as changed
+		for path in self.graph.files() - set(self.mtimes):
+			try:
+				self.mtimes[path] = os.stat(path).st_mtime
+			except OSError:
+				pass
+		return affected
+
+	def run(self):
+		self.report('Watching %s for changes, press Ctrl+C to stop' % ', '.join(self.inputs))
+		try:
+			while True:
+				self.poll()
+				time.sleep(self.interval)
+		except KeyboardInterrupt:
+			pass
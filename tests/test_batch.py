@@ -0,0 +1,56 @@
+"""
+Batch compiles: a failing page gets reported with its file and line, without stopping the batch or
+touching output of an earlier compile.
+"""
+
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import CompileError, batch, markuploader
+from rapydml.compiler import Parser, RAPYDML_DIR
+
+ENDS_IN_LOOP = 'div:\n\t"a"\nfor $i in [1:2]:\n\tp($undefined)\n'
+
+class BatchTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix='rapydml-test')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def write(self, name, source):
+		path = os.path.join(self.directory, name)
+		with open(path, 'w') as page:
+			page.write(source)
+		return path
+
+	def test_failing_page_gets_reported(self):
+		failing = self.write('eof.pyml', ENDS_IN_LOOP)
+		self.write('eof.html', 'old output\n')
+		ok = self.write('ok.pyml', 'div\n')
+		results = dict((result[0], result) for result in batch.compile_batch([failing, ok], 'html', RAPYDML_DIR, 1))
+		self.assertEqual(results[ok][3], None)
+		self.assertIn('Error in %s: line 4:' % failing, results[failing][3])
+		self.assertNotIn('Traceback', results[failing][3])
+		with open(os.path.join(self.directory, 'eof.html')) as output:
+			self.assertEqual(output.read(), 'old output\n')
+
+	def test_errors_closing_page_have_location(self):
+		path = self.write('eof.pyml', ENDS_IN_LOOP)
+		valid_tags = markuploader.load('html', RAPYDML_DIR)
+		compiles = [
+			lambda parser: parser.parse(path),
+			lambda parser: parser.parse_incremental(path),
+			lambda parser: ''.join(parser.stream(ENDS_IN_LOOP.splitlines(True), path)),
+		]
+		for compile_page in compiles:
+			try:
+				compile_page(Parser(valid_tags))
+			except CompileError as error:
+				self.assertEqual((error.filename, error.line_num), (path, 4))
+			else:
+				self.fail('page compiled')
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,70 @@
+"""
+The compile cache: entries on disk evicted least recently used first, compiled output only reused while
+the page and everything it imported stay the same.
+"""
+
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml.cache import DiskCache, CompileCache
+
+class CacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix='rapydml-test')
+		self.cache_dir = os.path.join(self.directory, 'cache')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def write(self, name, text):
+		path = os.path.join(self.directory, name)
+		with open(path, 'w') as source:
+			source.write(text)
+		return path
+
+	def test_disk_cache(self):
+		store = DiskCache(self.cache_dir)
+		self.assertEqual(store.get('page'), None)
+		store.set('page', 'output')
+		self.assertEqual(store.get('page'), 'output')
+		store.set('page', 'changed')
+		self.assertEqual(DiskCache(self.cache_dir).get('page'), 'changed')
+
+	def test_evicts_least_recently_used(self):
+		store = DiskCache(self.cache_dir, max_size=10)
+		store.set('a', '1234')
+		store.set('b', '1234')
+		os.utime(store.path('a'), (1000, 1000))
+		os.utime(store.path('b'), (2000, 2000))
+		store.get('a') # marks a as used, b becomes the least recently used entry
+		store.set('c', '1234')
+		self.assertEqual(store.get('b'), None)
+		self.assertEqual(store.get('a'), '1234')
+		self.assertEqual(store.get('c'), '1234')
+
+	def test_compile_cache(self):
+		page = self.write('page.pyml', 'import lib\n')
+		module = self.write('lib.pyml', 'x = 1\n')
+		markup = self.write('html.txt', 'div\n')
+		cache = CompileCache(self.cache_dir)
+		self.assertEqual(cache.lookup(page, markup), None)
+		cache.save(page, markup, '<div></div>\n', [module])
+		self.assertEqual(cache.lookup(page, markup), '<div></div>\n')
+		self.assertEqual(CompileCache(self.cache_dir, variant='minify').lookup(page, markup), None)
+		self.write('lib.pyml', 'x = 22\n')
+		self.assertEqual(cache.lookup(page, markup), None)
+		cache.save(page, markup, '<div></div>\n', [module])
+		self.write('html.txt', 'div\nspan\n')
+		self.assertEqual(cache.lookup(page, markup), None)
+
+	def test_corrupted_entry(self):
+		page = self.write('page.pyml', 'div\n')
+		markup = self.write('html.txt', 'div\n')
+		cache = CompileCache(self.cache_dir)
+		cache.save(page, markup, '<div></div>\n', [])
+		cache.store.set(cache.key(page, markup), 'not a pickle')
+		self.assertEqual(cache.lookup(page, markup), None)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,52 @@
+"""
+code_block commands get the text of the block on their STDIN, run in the directory of the page, and
+their output gets cached per command, text and directory.
+"""
+
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml.cache import DiskCache, CommandCache
+from rapydml.compiler import run_code_block
+
+class CodeBlockTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix='rapydml-test')
+		self.cache = CommandCache(DiskCache(os.path.join(self.directory, 'cache')))
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_stdin(self):
+		self.assertEqual(run_code_block(' | tr a-z A-Z', 'abc'), ('ABC\n', ''))
+		self.assertEqual(run_code_block(' > copy && cat copy', 'abc', directory=self.directory), ('abc\n', ''))
+		self.assertEqual(open(os.path.join(self.directory, 'copy')).read(), 'abc\n')
+		output, error = run_code_block(' | cat missing', 'abc', directory=self.directory)
+		self.assertTrue(error)
+
+	def test_cache(self):
+		command = ' | tr a-z A-Z && echo run >> runs'
+		runs = os.path.join(self.directory, 'runs')
+		for text in ('abc', 'abc', 'def'):
+			run_code_block(command, text, self.cache, self.directory)
+		self.assertEqual(open(runs).read(), 'run\nrun\n')
+		self.assertEqual(run_code_block(command, 'abc', self.cache, self.directory), ('ABC\n', ''))
+
+	def test_cache_per_directory(self):
+		first, second = os.path.join(self.directory, 'a'), os.path.join(self.directory, 'b')
+		for directory in (first, second):
+			os.mkdir(directory)
+			with open(os.path.join(directory, 'name'), 'w') as name:
+				name.write(os.path.basename(directory))
+		self.assertEqual(run_code_block(' > /dev/null; cat name', '', self.cache, first), ('a', ''))
+		self.assertEqual(run_code_block(' > /dev/null; cat name', '', self.cache, second), ('b', ''))
+
+	def test_errors_not_cached(self):
+		self.assertTrue(run_code_block(' | cat missing', 'abc', self.cache, self.directory)[1])
+		with open(os.path.join(self.directory, 'missing'), 'w') as missing:
+			missing.write('found')
+		self.assertEqual(run_code_block(' | cat missing', 'abc', self.cache, self.directory), ('found', ''))
+
+if __name__ == '__main__':
+	unittest.main()
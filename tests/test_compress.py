@@ -0,0 +1,68 @@
+"""
+Precompressed variants get written along with the page, and only rewritten when their content changes,
+so that their modification times stay put for pages that compiled the same as before.
+"""
+
+import os, sys, gzip, zlib, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import ParserError
+from rapydml.compress import Compression
+
+PAGE = '<div class="item">text</div>\n' * 100
+
+class CompressTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix='rapydml-test')
+		self.path = os.path.join(self.directory, 'page.html')
+		self.compression = Compression(('gz', 'zz'))
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def write(self, page, compression=None):
+		output = (compression or self.compression).open(self.path)
+		output.write(page)
+		return output.close()
+
+	def test_variants(self):
+		self.assertEqual(self.write(PAGE), [self.path + '.gz', self.path + '.zz'])
+		self.assertEqual(open(self.path).read(), PAGE)
+		self.assertEqual(gzip.open(self.path + '.gz').read(), PAGE)
+		self.assertEqual(zlib.decompress(open(self.path + '.zz', 'rb').read()), PAGE)
+
+	def test_rewritten_on_change(self):
+		self.write(PAGE)
+		for format in ('gz', 'zz'):
+			os.utime('%s.%s' % (self.path, format), (1000, 1000))
+		self.assertEqual(self.write(PAGE), [])
+		self.assertEqual(os.path.getmtime(self.path + '.gz'), 1000)
+		self.assertEqual(self.write(PAGE + 'more\n'), [self.path + '.gz', self.path + '.zz'])
+		self.assertNotEqual(os.path.getmtime(self.path + '.gz'), 1000)
+		self.assertEqual(gzip.open(self.path + '.gz').read(), PAGE + 'more\n')
+
+	def test_small_page(self):
+		self.write(PAGE)
+		self.assertEqual(self.write('<div></div>\n'), [])
+		self.assertFalse(os.path.exists(self.path + '.gz'))
+		self.assertFalse(os.path.exists(self.path + '.zz'))
+
+	def test_failed_page_keeps_variants(self):
+		self.write(PAGE)
+		try:
+			with self.compression.open(self.path) as output:
+				output.write('<div>')
+				raise ParserError('failed')
+		except ParserError:
+			pass
+		self.assertEqual(gzip.open(self.path + '.gz').read(), PAGE)
+
+	def test_settings(self):
+		self.assertRaises(ParserError, Compression, ('bz2',))
+		self.assertRaises(ParserError, Compression, ('gz',), 10)
+		settings = Compression(('zz',), 5, 10).settings()
+		self.assertEqual(Compression(**settings).settings(), settings)
+
+if __name__ == '__main__':
+	unittest.main()
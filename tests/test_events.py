@@ -0,0 +1,96 @@
+"""
+Events have to write out as the text output, minified or not, and build into a matching ElementTree.
+"""
+
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import markuploader, compile_string, compile_events, compile_tree
+from rapydml.compiler import Parser
+from rapydml.events import START, END, TEXT, VERBATIM, build_tree
+from benchmarks.events import write_text, RAPYDML_DIR
+from benchmarks.workloads import WORKLOADS, generate
+
+SCALE = 0.05
+PAGE = '''import lib.common
+html:
+	body(class="main page", data-x=5):
+		div(id="a"):
+			"line one"
+			"line two"
+			input(type="checkbox", checked)
+		javascript:
+			var x = 1 < 2;
+'''
+
+class EventsTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix='rapydml-test')
+		self.valid_tags = markuploader.load('html', RAPYDML_DIR)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def write(self, name, source):
+		path = os.path.join(self.directory, name)
+		with open(path, 'w') as page:
+			page.write(source)
+		return path
+
+	def test_workloads_match_text(self):
+		for name in sorted(WORKLOADS):
+			path = self.write(name + '.pyml', generate(name, max(1, int(WORKLOADS[name][1] * SCALE))))
+			with open(path, 'r') as page:
+				events = list(Parser(self.valid_tags).iterevents(page, path, self.directory))
+			self.assertEqual(write_text(events), Parser(self.valid_tags).parse(path), name)
+			self.assertEqual(write_text(events, True), Parser(self.valid_tags, minify=True).parse(path), name)
+			build_tree(events, 'document')
+
+	def test_page_matches_text(self):
+		path = self.write('page.pyml', PAGE + '	pre:\n\t\tspan\n\t\t"  kept  "\n')
+		with open(path, 'r') as page:
+			events = list(Parser(self.valid_tags).iterevents(page, path, self.directory))
+		self.assertEqual(write_text(events), Parser(self.valid_tags).parse(path))
+		self.assertEqual(write_text(events, True), Parser(self.valid_tags, minify=True).parse(path))
+
+	def test_events(self):
+		events = list(compile_events(PAGE.splitlines(True)))
+		self.assertEqual(events, [
+			(START, ('html', [], '')),
+			(START, ('body', [('class', 'main page'), ('data-x', '5')], '\t')),
+			(START, ('div', [('id', 'a')], '\t\t')),
+			(TEXT, ('\t\t\t', 'line one')),
+			(TEXT, ('\t\t\t', 'line two')),
+			(START, ('input', [('type', 'checkbox'), ('checked', None)], '\t\t\t')),
+			(END, ('input', '\t\t\t', '', True)),
+			(END, ('div', '\t\t', '</div>', False)),
+			(VERBATIM, ('\t\t', '<script type="text/javascript">', 'var x = 1 < 2;\n', '</script>')),
+			(END, ('body', '\t', '</body>', False)),
+			(END, ('html', '', '</html>', False)),
+		])
+
+	def test_attributes_match_text(self):
+		source = 'div(class=a b, title=\'say "hi"\', {{=extra}}, checked)\n'
+		events = list(compile_events([source]))
+		attributes = [('class', 'a b'), ('title', 'say "hi"'), ('{{=extra}}', None), ('checked', None)]
+		self.assertEqual(events[0], (START, ('div', attributes, '')))
+		self.assertEqual(write_text(events), compile_string(source))
+		self.assertTrue(compile_string(source).startswith('<div class="a b" title=\'say "hi"\' {{=extra}} checked>'))
+
+	def test_tree(self):
+		tree = compile_tree(self.write('page.pyml', PAGE))
+		self.assertEqual(tree.tag, 'html')
+		div = tree.find('body/div')
+		self.assertEqual(div.get('id'), 'a')
+		self.assertEqual(div.text, 'line one\nline two')
+		self.assertEqual(div.find('input').get('checked'), 'checked')
+		self.assertEqual(tree.find('body/script').text, 'var x = 1 < 2;\n')
+
+	def test_fragment_needs_root(self):
+		path = self.write('fragment.pyml', 'div\np\n')
+		self.assertRaises(Exception, compile_tree, path)
+		self.assertEqual([element.tag for element in compile_tree(path, root='body')], ['div', 'p'])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,46 @@
+"""
+Expressions evaluated for arithmetic and python. calls: only safe names and syntax, no way into the
+interpreter's internals, no results too large to compute, and a bounded cache of compiled code.
+"""
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import ParserError, expression
+from rapydml.expression import evaluate
+
+class ExpressionTest(unittest.TestCase):
+
+	def test_allowed(self):
+		self.assertEqual(evaluate('1 + 2 * 3'), 7)
+		self.assertEqual(evaluate('2 ** 10 + (1 << 4)'), 1040)
+		self.assertEqual(evaluate('max(len("abc"), int(math.sqrt(16)))'), 4)
+		self.assertEqual(evaluate('"abc".upper()'), 'ABC')
+		self.assertEqual(evaluate('sorted([3, 1])'), [1, 3])
+
+	def test_rejected(self):
+		for source in ('open("/etc/passwd")', '__import__("os")', 'lambda: 1', '[x for x in (1, 2)]',
+						'(1).__class__', '"{0.__class__.__mro__}".format(1)', 'str.format("{0}", 1)'):
+			self.assertRaises(ParserError, evaluate, source)
+
+	def test_results_too_large(self):
+		for source in ('9**9**9', '2 ** 100000', '1 << 100000', '(1 + 1) ** 10 ** 6'):
+			self.assertRaises(ParserError, evaluate, source)
+		self.assertEqual(evaluate('1 ** 10 ** 12'), 1)
+		self.assertEqual(evaluate('2.0 ** -1'), 0.5)
+
+	def test_cache_evicts_least_recently_used(self):
+		limit, expression.MAX_CACHED_EXPRESSIONS = expression.MAX_CACHED_EXPRESSIONS, 2
+		try:
+			expression.compiled_expressions.clear()
+			evaluate('1 + 1')
+			evaluate('2 + 2')
+			evaluate('1 + 1') # most recently used, so it has to survive the next one
+			evaluate('3 + 3')
+			self.assertEqual(list(expression.compiled_expressions), ['1 + 1', '3 + 3'])
+		finally:
+			expression.MAX_CACHED_EXPRESSIONS = limit
+			expression.compiled_expressions.clear()
+
+if __name__ == '__main__':
+	unittest.main()
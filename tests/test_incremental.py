@@ -0,0 +1,72 @@
+"""
+Parser.parse_incremental reuses blocks of the previous compile, after any edit its output has to match a
+full compile of the edited page, minified or not.
+"""
+
+import os, sys, random, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import markuploader
+from rapydml.compiler import Parser
+from rapydml.util import CompileError
+from benchmarks.incremental import edit, RAPYDML_DIR
+from benchmarks.workloads import WORKLOADS, generate
+
+EDITS = 8
+SCALE = 0.05
+
+class IncrementalTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix='rapydml-test')
+		self.valid_tags = markuploader.load('html', RAPYDML_DIR)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def check_edits(self, name, minify=False):
+		# edits random lines of the workload one at a time, comparing incremental and full compiles
+		rng = random.Random(name)
+		path = os.path.join(self.directory, name + '.pyml')
+		lines = generate(name, max(1, int(WORKLOADS[name][1] * SCALE))).splitlines(True)
+		with open(path, 'w') as page:
+			page.writelines(lines)
+		incremental = Parser(self.valid_tags, minify=minify)
+		incremental.parse_incremental(path)
+		for i in range(EDITS):
+			previous = list(lines)
+			line_num = edit(lines, rng)
+			with open(path, 'w') as page:
+				page.writelines(lines)
+			try:
+				expected = Parser(self.valid_tags, minify=minify).parse(path)
+			except CompileError:
+				# edits can break the page (i.e. by renaming a method), then both compiles have to fail
+				self.assertRaises(CompileError, incremental.parse_incremental, path, incremental.blocks)
+				lines = previous
+				with open(path, 'w') as page:
+					page.writelines(lines)
+				incremental.parse_incremental(path)
+				continue
+			output = incremental.parse_incremental(path, incremental.blocks)
+			self.assertEqual(output, expected, '%s: output after editing line %d differs' % (name, line_num))
+
+	def test_workloads(self):
+		for name in sorted(WORKLOADS):
+			self.check_edits(name)
+
+	def test_workloads_minified(self):
+		for name in sorted(WORKLOADS):
+			self.check_edits(name, minify=True)
+
+	def test_unchanged_page_reuses_blocks(self):
+		path = os.path.join(self.directory, 'page.pyml')
+		with open(path, 'w') as page:
+			page.write(generate('wide_siblings', 100))
+		parser = Parser(self.valid_tags)
+		expected = parser.parse_incremental(path)
+		self.assertEqual(parser.parse_incremental(path, parser.blocks), expected)
+		self.assertEqual(parser.reused_blocks, len(parser.blocks))
+
+if __name__ == '__main__':
+	unittest.main()
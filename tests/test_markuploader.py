@@ -0,0 +1,74 @@
+"""
+Markup grammars get compiled into schemas next to them: frozensets of allowed attributes, shared between
+tags that inherit them, recompiled whenever the grammar changes.
+"""
+
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import markuploader
+from rapydml.markuploader import NORMAL, SEPARATE, SINGLE
+
+GRAMMAR = '''# test markup
+<br>- *
+<.>	id, class
+	<div>+
+	<p>
+	<a> href, \\
+		target
+'''
+
+class MarkupLoaderTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix='rapydml-test')
+		os.mkdir(os.path.join(self.directory, 'markup'))
+		self.grammar = os.path.join(self.directory, 'markup', 'test')
+		self.write(GRAMMAR)
+		markuploader.schemas.clear()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+		markuploader.schemas.clear()
+
+	def write(self, text):
+		with open(self.grammar, 'w') as grammar:
+			grammar.write(text)
+
+	def load(self):
+		return markuploader.load('test', self.directory)
+
+	def check(self, tags):
+		self.assertEqual(tags['br'], (SINGLE, None))
+		self.assertEqual(tags['div'], (SEPARATE, frozenset(['id', 'class'])))
+		self.assertEqual(tags['a'], (NORMAL, frozenset(['id', 'class', 'href', 'target'])))
+
+	def test_schema(self):
+		self.check(self.load())
+		self.assertTrue(os.path.isfile(markuploader.schema_filename(self.grammar)))
+		markuploader.schemas.clear()
+		stat = os.stat(self.grammar)
+		tags = markuploader.read_schema(self.grammar, (markuploader.SCHEMA_VERSION, stat.st_mtime, stat.st_size))
+		self.check(tags)
+		# tags that don't add attributes of their own share the set they inherit, also after unpickling
+		self.assertTrue(tags['div'][1] is tags['p'][1])
+		self.assertTrue(self.load()['div'][1] is self.load()['p'][1])
+		self.assertEqual(self.load(), tags)
+
+	def test_stale_schema(self):
+		self.load()
+		markuploader.schemas.clear()
+		self.write(GRAMMAR + '<span>\n')
+		self.assertEqual(self.load()['span'], (NORMAL, frozenset()))
+		markuploader.schemas.clear()
+		self.assertTrue('span' in self.load())
+
+	def test_corrupted_schema(self):
+		self.load()
+		markuploader.schemas.clear()
+		with open(markuploader.schema_filename(self.grammar), 'w') as schema:
+			schema.write('not a pickle')
+		self.check(self.load())
+
+if __name__ == '__main__':
+	unittest.main()
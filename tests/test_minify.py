@@ -0,0 +1,42 @@
+"""
+Minified output leaves out whitespace the page renders the same without: line breaks next to block-level
+elements go, those next to text and between inline elements stay, where they stand for a space.
+"""
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import compile_string
+from rapydml.events import OUTPUT_BLOCK, OUTPUT_INLINE, tag_kind
+
+class MinifyTest(unittest.TestCase):
+
+	def minify(self, source):
+		return compile_string(source, minify=True)
+
+	def test_tag_kind(self):
+		self.assertEqual(tag_kind('<div class="a">'), OUTPUT_BLOCK)
+		self.assertEqual(tag_kind('</LI>'), OUTPUT_BLOCK)
+		self.assertEqual(tag_kind('<!-- comment -->'), OUTPUT_BLOCK)
+		self.assertEqual(tag_kind('<img src="a.png" />'), OUTPUT_INLINE)
+		self.assertEqual(tag_kind('<my-widget>'), OUTPUT_INLINE)
+
+	def test_inline_tags_keep_line_breaks(self):
+		source = 'div:\n\timg(src="a.png")\n\timg(src="b.png")\n\tinput(type="text")\n\tspan:\n\t\t"x"\n'
+		self.assertEqual(self.minify(source),
+			'<div><img src="a.png" />\n<img src="b.png" />\n<input type="text" />\n<span>\nx\n</span></div>')
+
+	def test_block_tags_drop_line_breaks(self):
+		source = 'ul:\n\tli:\n\t\tdiv\n\tli:\n\t\tp\n'
+		self.assertEqual(self.minify(source), '<ul><li><div></div></li><li><p /></li></ul>')
+
+	def test_text_keeps_line_breaks(self):
+		source = 'p:\n\t"one"\n\t"two"\n'
+		self.assertEqual(self.minify(source), '<p>\none\ntwo\n</p>')
+
+	def test_after_preserved_element(self):
+		self.assertEqual(self.minify('div:\n\ttextarea\n\timg\n'), '<div><textarea>\n\t</textarea>\n<img /></div>')
+		self.assertEqual(self.minify('div:\n\tpre:\n\t\t"a"\n\timg\n'), '<div><pre>\n\t\ta\n\t</pre><img /></div>')
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,32 @@
+"""
+Profiles have to account for all of the time compiling a page took, each line getting counted as a call of
+the tags phase.
+"""
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import markuploader
+from rapydml.compiler import Parser, RAPYDML_DIR
+from rapydml.profiler import Profiler
+
+PAGE = 'div:\n\t"a"\n\tp($x)\n'
+
+class ProfilerTest(unittest.TestCase):
+
+	def test_report_adds_up(self):
+		ticks = iter(range(100000))
+		profiler = Profiler(clock=lambda: float(next(ticks)))
+		valid_tags = markuploader.load('html', RAPYDML_DIR)
+		Parser(valid_tags, profiler=profiler).parse_string('$x := 1\n' + PAGE)
+		results = profiler.results()
+		self.assertEqual(results['phases']['tags']['calls'], 4)
+		self.assertEqual(results['total'], sum(stats['seconds'] for stats in results['phases'].values()))
+		self.assertEqual(results['total'], profiler.mark - profiler.started)
+		lines = sum(line['seconds'] for line in results['lines'])
+		# time outside of the parser's phases may or may not belong to a line, everything else does
+		self.assertTrue(results['total'] - profiler.phase_times.get('other', 0) <= lines <= results['total'])
+		self.assertIn('other', profiler.report())
+
+if __name__ == '__main__':
+	unittest.main()
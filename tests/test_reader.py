@@ -0,0 +1,50 @@
+"""
+Reading lines of pages and modules, and the cache of imported modules.
+"""
+
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import reader, compile_file
+
+class ModuleCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix='rapydml-test')
+		reader.module_cache.clear()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+		reader.module_cache.clear()
+
+	def write(self, name, source):
+		path = os.path.join(self.directory, name)
+		with open(path, 'w') as page:
+			page.write(source)
+		return path
+
+	def test_only_modules_get_cached(self):
+		module = self.write('common.pyml', '$title := Hello\n')
+		page = self.write('index.pyml', 'import common\nh1($title)\n')
+		self.assertIn('Hello', compile_file(page))
+		self.assertEqual(list(reader.module_cache), [module])
+
+	def test_cache_is_bounded(self):
+		limit, reader.MAX_CACHED_MODULES = reader.MAX_CACHED_MODULES, 3
+		try:
+			paths = [self.write('module%d.pyml' % i, 'div\n') for i in range(5)]
+			for path in paths:
+				reader.load(path)
+			reader.load(paths[2]) # most recently used, so it has to survive the next one
+			reader.load(self.write('last.pyml', 'div\n'))
+			self.assertEqual(list(reader.module_cache), [paths[4], paths[2], os.path.join(self.directory, 'last.pyml')])
+		finally:
+			reader.MAX_CACHED_MODULES = limit
+
+	def test_lines(self):
+		lines = list(reader.iter_lines(['div:\n', '\t# comment\n', '\t"a\\\n', '\tb"\n', '\n']))
+		self.assertEqual([(line.lineno, line.tag, line.blank) for line in lines],
+						[(1, 'div:', False), (2, '# comment', True), (4, '"a b"', False), (5, '', True)])
+
+if __name__ == '__main__':
+	unittest.main()
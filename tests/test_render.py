@@ -0,0 +1,42 @@
+"""
+Python module backend: slots filled in when the page renders.
+"""
+
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import CompileError
+from rapydml.api import compile_render
+
+VALUE = 'x onmouseover=alert(1) "<b>\''
+
+class RenderTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix='rapydml-test')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def render(self, source, **context):
+		path = os.path.join(self.directory, 'page.pyml')
+		with open(path, 'w') as page:
+			page.write('$user := slot()\n$html := slot(raw)\n' + source)
+		return compile_render(path)(**context)
+
+	def test_text_gets_escaped(self):
+		output = self.render('div:\n\t"hi $user"\n\t"$html"\n', user=VALUE, html='<b>')
+		self.assertIn('hi x onmouseover=alert(1) &quot;&lt;b&gt;&#39;\n', output)
+		self.assertIn('\t<b>\n', output)
+
+	def test_attribute_values_get_quoted(self):
+		output = self.render('div(title=$user, href=/u/$user, data-a=\'a $user\', alt="a"$user"b"):\n\t"x"\n', user=VALUE)
+		escaped = 'x onmouseover=alert(1) &quot;&lt;b&gt;&#39;'
+		self.assertIn('<div title="%s" href="/u/%s" data-a="a %s" alt=\'"a"%s"b"\'>' % ((escaped,) * 4), output)
+
+	def test_slots_outside_attribute_values_are_rejected(self):
+		for tag in ('div($user)', 'div($user=1)', '$user(title=1)'):
+			self.assertRaises(CompileError, self.render, '%s:\n\t"x"\n' % tag, user='a')
+
+if __name__ == '__main__':
+	unittest.main()
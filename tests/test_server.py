@@ -0,0 +1,80 @@
+"""
+The daemon compiles pages it gets asked to over its socket the same way the CLI would on its own, keeps
+preludes warm until their files change, and answers bad requests with errors rather than going away.
+"""
+
+import os, sys, shutil, tempfile, threading, time, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import ParserError, client, compile_file
+from rapydml.batch import ACKNOWLEDGEMENT
+from rapydml.server import Daemon, Server
+
+RAPYDML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rapydml')
+
+class ServerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix='rapydml-test')
+		self.socket = os.path.join(self.directory, 'daemon.sock')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def write(self, name, source):
+		path = os.path.join(self.directory, name)
+		with open(path, 'w') as page:
+			page.write(source)
+		return path
+
+	def read(self, name):
+		with open(os.path.join(self.directory, name)) as page:
+			return page.read()
+
+	def start(self):
+		# daemon without worker processes, pages get compiled by the thread handling the connection
+		server = Server(self.socket, Daemon(RAPYDML_DIR, 2))
+		thread = threading.Thread(target=server.serve_forever)
+		thread.start()
+		return server, thread
+
+	def test_compile(self):
+		page = self.write('page.pyml', 'div(id="a"):\n\t"text"\n')
+		broken = self.write('broken.pyml', 'nosuchtag\n')
+		server, thread = self.start()
+		try:
+			results = client.forward([page, broken], 'html', path=self.socket)
+			self.assertEqual([result[0] for result in results], [page, broken])
+			self.assertEqual(results[0][3], None)
+			self.assertTrue(results[1][3])
+			self.assertEqual(self.read('page.html'), ACKNOWLEDGEMENT + compile_file(page))
+			self.assertEqual(client.request({'command': 'ping'}, self.socket)['pid'], os.getpid())
+			stats = client.request({'command': 'stats'}, self.socket)
+			self.assertEqual((stats['pages'], stats['failures']), (2, 1))
+			self.assertEqual(stats['requests'], {'compile': 1, 'ping': 1})
+			self.assertTrue('latency_ms' in stats)
+			self.assertRaises(ParserError, client.request, {'command': 'unknown'}, self.socket)
+		finally:
+			client.request({'command': 'shutdown'}, self.socket)
+			thread.join()
+			server.server_close()
+
+	def test_no_daemon(self):
+		self.assertEqual(client.request({'command': 'ping'}, self.socket), None)
+		self.assertEqual(client.forward([], 'html', path=self.socket), None)
+
+	def test_prelude(self):
+		self.write('base.pyml', 'def box():\n\tdiv(class="old")\n')
+		page = self.write('page.pyml', 'box()\n')
+		daemon = Daemon(RAPYDML_DIR, 1)
+		message = {'sources': [page], 'prelude': ['base'], 'prelude_dir': self.directory, 'acknowledge': False}
+		self.assertEqual(daemon.compile(message)[0][3], None)
+		self.assertEqual(self.read('page.html'), '<div class="old">\n</div>\n')
+		self.write('base.pyml', 'def box():\n\tdiv(class="new")\n')
+		later = time.time() + 10 # so that the prelude's modification time changes even within a second
+		os.utime(os.path.join(self.directory, 'base.pyml'), (later, later))
+		self.assertEqual(daemon.compile(message)[0][3], None)
+		self.assertEqual(self.read('page.html'), '<div class="new">\n</div>\n')
+
+if __name__ == '__main__':
+	unittest.main()
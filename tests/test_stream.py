@@ -0,0 +1,52 @@
+"""
+Streamed compilation reads the page as it goes and passes output on in chunks, which have to add up to
+the output of compiling the page as a whole.
+"""
+
+import os, sys, unittest
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rapydml import CompileError, compile_string, compile_stream
+from benchmarks.workloads import WORKLOADS, generate
+
+SCALE = 0.05
+
+class StreamTest(unittest.TestCase):
+
+	def test_workloads_match_string(self):
+		for name in sorted(WORKLOADS):
+			source = generate(name, max(1, int(WORKLOADS[name][1] * SCALE)))
+			for minify in (False, True):
+				expected = compile_string(source, minify=minify)
+				chunks = list(compile_stream(source.splitlines(True), chunk_size=256, minify=minify))
+				self.assertEqual(''.join(chunks), expected, name)
+				sink = StringIO()
+				self.assertEqual(compile_stream(source.splitlines(True), sink, chunk_size=256, minify=minify),
+								len(expected))
+				self.assertEqual(sink.getvalue(), expected, name)
+
+	def test_lines_read_lazily(self):
+		read = []
+		def lines():
+			for i in range(1000):
+				read.append(i)
+				yield 'div(id="item%d")\n' % i
+		chunks = compile_stream(lines(), chunk_size=64)
+		first = next(chunks)
+		self.assertTrue(first.startswith('<div id="item0">'))
+		self.assertTrue(len(read) < 100)
+		self.assertEqual((first + ''.join(chunks)).count('<div'), 1000)
+
+	def test_error_after_output(self):
+		sink = StringIO()
+		lines = ['div(id="item%d")\n' % i for i in range(100)] + ['nosuchmethod()\n']
+		try:
+			compile_stream(lines, sink, chunk_size=64)
+			self.fail('page compiled')
+		except CompileError as error:
+			self.assertEqual(error.line_num, 101)
+		self.assertTrue(sink.getvalue().startswith('<div id="item0">'))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,57 @@
+"""
+Concurrent compiles on a thread pool have to produce exactly the serial output, pages live in separate
+directories that each have their own version of the same module, so resolving an import (or running a
+code_block) relative to the wrong page shows up as a mismatch.
+"""
+
+import os, sys, shutil, tempfile, unittest
+from multiprocessing.pool import ThreadPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from benchmarks.threads import prepare, compile_page
+
+THREADS = 8
+ROUNDS = 3
+SCALE = 0.02
+
+class ThreadsTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix='rapydml-test')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def test_concurrent_compiles_match_serial(self):
+		cwd = os.getcwd()
+		sources = prepare(self.directory, SCALE)
+		expected = dict((path, compile_page(path)) for path in sources)
+		jobs = sources * ROUNDS
+		pool = ThreadPool(THREADS)
+		try:
+			outputs = pool.map(compile_page, jobs)
+		finally:
+			pool.close()
+			pool.join()
+		for path, output in zip(jobs, outputs):
+			self.assertEqual(output, expected[path], 'output of %s differs from serial compile' % path)
+		self.assertEqual(os.getcwd(), cwd)
+
+	def test_module_added_to_earlier_directory_gets_picked_up(self):
+		# the daemon and watch mode keep running while modules get added, lookups mustn't be remembered
+		from rapydml import create_parser, compile_file
+		page, library = os.path.join(self.directory, 'page'), os.path.join(self.directory, 'library')
+		os.makedirs(page)
+		os.makedirs(library)
+		with open(os.path.join(library, 'common.pyml'), 'w') as module:
+			module.write('$where := library\n')
+		with open(os.path.join(page, 'index.pyml'), 'w') as source:
+			source.write('import common\ndiv($where)\n')
+		parser = create_parser(search_path=[library])
+		self.assertIn('library', compile_file(os.path.join(page, 'index.pyml'), parser=parser))
+		with open(os.path.join(page, 'common.pyml'), 'w') as module:
+			module.write('$where := page\n')
+		self.assertIn('page', compile_file(os.path.join(page, 'index.pyml'), parser=parser))
+
+if __name__ == '__main__':
+	unittest.main()